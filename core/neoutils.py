@@ -652,6 +652,9 @@ IX Generic indexing for the neo framework (provisional)
 
 """
 #### BEGIN core python modules
+import os
+import re
+import copy
 import traceback
 import datetime
 import collections
@@ -661,6 +664,7 @@ import itertools
 import functools
 import warnings
 import typing
+import concurrent.futures
 from enum import Enum, IntEnum
 #### END core python modules
 
@@ -670,6 +674,17 @@ import quantities as pq
 import neo
 import matplotlib as mpl
 import pyqtgraph as pg
+
+try:
+    import numba
+    __has_numba__ = True
+    
+except ImportError:
+    __has_numba__ = False
+    
+# NOTE: floating point dtypes handled by the numba kernels in this module; 
+# other dtypes (e.g. float16) take the numpy code paths
+__numba_float_dtypes__ = (np.dtype(np.float32), np.dtype(np.float64))
 #### END 3rd party modules
 
 #### BEGIN pict.core modules
@@ -677,7 +692,7 @@ import pyqtgraph as pg
 from .prog import safeWrapper
 from .datatypes import  normalized_index
 from .datasignal import DataSignal, IrregularlySampledDataSignal
-from .triggerprotocols import TriggerEvent, TriggerProtocol
+from .triggerprotocols import TriggerEvent, TriggerEventType, TriggerProtocol
 from .scandata import ScanData
 
 from . import datatypes as dt
@@ -698,8 +713,29 @@ if __debug__:
     __debug_count__ = 0
 
 def get_neo_version() -> tuple:
-    major, minor, dot = neo.version.version.split(".")
-    return eval(major), eval(minor), eval(dot)
+    """Returns the (major, minor, dot) numbers of the installed neo version.
+    
+    Only the leading digits of the first three parts of the version string are
+    used, so that pre-release or development versions (e.g. "0.9.0rc1", 
+    "0.10.0.dev0") are parsed as well; missing parts are 0.
+    """
+    ret = list()
+    
+    for part in neo.version.version.split(".")[:3]:
+        m = re.match(r"\d+", part)
+        ret.append(int(m.group()) if m else 0)
+        
+    ret.extend([0] * (3 - len(ret)))
+    
+    return tuple(ret)
+
+# NOTE: the neo version does not change during a session; query it only once
+__neo_version__ = get_neo_version()
+
+__neo_ge_8__ = __neo_version__[:2] >= (0, 8)
+
+# NOTE: names of the trigger event types, for lookup by name
+__trigger_event_type_names__ = frozenset(TriggerEventType.__members__)
 
 #"def" silentindex(a, b):
     #""" Call this instead of list.index, such that a missing value returns None instead
@@ -780,8 +816,6 @@ def correlate(in1, in2, **kwargs):
     
     from scipy.signal import correlate
     
-    from . import datatypes as dt
-    
     name = kwargs.pop("name", "")
     
     units = kwargs.pop("units", pq.dimensionless)
@@ -1256,7 +1290,6 @@ def signal2epoch(sig, name=None, labels=None):
         When an array it must have the same length as sig.
     
     """
-    from . import datatypes as dt
     
     if not isinstance(sig, neo.IrregularlySampledSignal):
         raise TypeError("Expecting a neo.IrregularlySampledSignal; got %s instead" % type(sig).__name__)
@@ -2352,7 +2385,6 @@ def get_signal_names_indices(data: typing.Union[neo.Segment, typing.Sequence],
             used only when data is a neo.Segment (as it may contain either of the above)
     
     """
-    from . import datatypes as dt
     
     if isinstance(data, neo.Segment):
         if analog:
@@ -2398,7 +2430,7 @@ def normalized_segment_index(src: neo.Block,
     elif isinstance(src, neo.Segment):
         src = [src]
         
-    elif not isinstance(src, (tuple, list)) or not all([isinstance(s, neo.Segment) for s in src]):
+    elif not isinstance(src, (tuple, list)) or not all(isinstance(s, neo.Segment) for s in src):
         raise TypeError("src expected to be a neo.Block, a sequence of neo.Segments, or a neo.Segment; got %s instead" % type(src).__name__)
     
     data_len = len(src)
@@ -2828,8 +2860,6 @@ def normalized_signal_index(src: neo.core.container.Container,
     a range or list of integer indices
     
     """
-    major, minor, dot = get_neo_version()
-    
     data_len = None
     
     if not isinstance(src, (neo.Segment, neo.ChannelIndex, neo.Unit)):
@@ -2866,7 +2896,7 @@ def normalized_signal_index(src: neo.core.container.Container,
             
         signal_collection = src.epochs
         
-    elif any([major >= 0, minor >= 8]) and ctype is neo.core.ImageSequence:
+    elif __neo_ge_8__ and ctype is neo.core.ImageSequence:
         if not isinstance(src, neo.Segment):
             raise TypeError("%s does not contain %s" % (type(src).__name__, ctype.__name__))
             
@@ -3035,14 +3065,17 @@ def get_index_of_named_signal(src, names, stype=neo.AnalogSignal, silent=False):
     
     Such signals will be skipped / missed!
     """
-    from . import datatypes as dt
     
     signal_collection = "%ss" % stype.__name__.lower()
     
     if signal_collection == "datasignals":
         signal_collection = "analogsignals"
+        
+    # NOTE: dispatch on the type of 'names'; str, list or tuple subclasses 
+    # (e.g. numpy.str_) are found by isinstance
+    handler = __dispatch_handler__(__named_signal_index_dispatch__, names)
     
-    if isinstance(src, neo.core.Block) or (isinstance(src, (tuple, list)) and all([isinstance(s, neo.Segment) for s in src])):
+    if isinstance(src, neo.core.Block) or (isinstance(src, (tuple, list)) and all(isinstance(s, neo.Segment) for s in src)):
         # construct a list of indices (or list of lists of indices) of the named
         # signal(s) in each of the Block's segments
         
@@ -3051,68 +3084,74 @@ def get_index_of_named_signal(src, names, stype=neo.AnalogSignal, silent=False):
             
         else:
             data = src
-        
-        if isinstance(names, str):
-            # NOTE: 2017-12-14 00:54:06
-            # I don't think this is really necessary because DataSignal objects
-            # can be very well contained in the analogsignals list of a segment
-            # alongside neo.AnalogSignal objects ( guess ... TODO check this)
-            
-            if silent:
-                return [utilities.silentindex([i.name for i in getattr(j, signal_collection)], names) for j in data]
-            
-            return [[i.name for i in getattr(j, signal_collection)].index(names) for j in data]
-             
-        elif isinstance(names, (list, tuple)):
-            if np.all([isinstance(i,str) for i in names]):
-                # proceed only if all elements in names are strings and return a 
-                # list of lists, where each list element has the indices for a given
-                # signal name
-                if silent:
-                    return [[utilities.silentindex([i.name for i in getattr(j, signal_collection)], k) for k in names] for j in data]
-                
-                return [[[i.name for i in getattr(j, signal_collection)].index(k) for k in names ] for j in data]
-                
-    elif isinstance(src, neo.core.Segment):
-        objectList = getattr(src, signal_collection)
-        #if stype in (neo.AnalogSignal, DataSignal) or \
-            #(isinstance(stype, (tuple, list)) and all([s.__name__ in ("AnalogSignal", "DataSignal") for s in stype])):
-            #objectList = src.analogsignals
             
-        #elif stype is neo.IrregularlySampledSignal:
-            #objectList = src.irregularlysampledsignals
-            
-        #elif stype is neo.SpikeTrain:
-            #objectList = src.spiketrains
-            
-        #elif stype is neo.Event:
-            #objectList = src.events
-            
-        #elif stype is neo.Epoch:
-            #objectList = src.epochs
-            
-        #else:
-            #raise TypeError("Invalid stype")
+        # NOTE: 2017-12-14 00:54:06
+        # I don't think this is really necessary because DataSignal objects
+        # can be very well contained in the analogsignals list of a segment
+        # alongside neo.AnalogSignal objects ( guess ... TODO check this)
         
-        if isinstance(names, str):
-            if silent:
-                return utilities.silentindex([i.name for i in objectList], names)
-            
-            return [i.name for i in objectList].index(names)
-            
-        elif isinstance(names, (list, tuple)):
-            if np.all([isinstance(i,str) for i in names]):
-                if silent:
-                    return [utilities.silentindex([i.name for i in objectList], j) for j in names]
+        if handler is None or (handler is __names_index__ and not all([isinstance(i, str) for i in names])):
+            # proceed only if 'names' is a str or all elements in names are 
+            # strings, and return a list of lists, where each list element 
+            # has the indices for a given signal name
+            return
+        
+        return [handler(getattr(j, signal_collection), names, silent) for j in data]
                 
-                return [[i.name for i in objectList].index(j) for j in names]
-            
-        else:
+    elif isinstance(src, neo.core.Segment):
+        if handler is None:
             raise TypeError("Invalid indexing")
         
+        if handler is __names_index__ and not all([isinstance(i, str) for i in names]):
+            return
+        
+        return handler(getattr(src, signal_collection), names, silent)
+        
     else:
         raise TypeError("First argument must be a neo.Block object, a list of neo.Segment objects, or a neo.Segment object; got %s instead" % type(src).__name__)
 
+def __name_index__(objectList, name, silent):
+    """Index of the object named 'name' in objectList.
+    Helper for get_index_of_named_signal
+    """
+    object_names = [i.name for i in objectList]
+    
+    if silent:
+        return utilities.silentindex(object_names, name)
+    
+    return object_names.index(name)
+
+def __names_index__(objectList, names, silent):
+    """List of indices of the objects named as in 'names', in objectList.
+    Helper for get_index_of_named_signal
+    """
+    object_names = [i.name for i in objectList]
+    
+    if silent:
+        return [utilities.silentindex(object_names, k) for k in names]
+    
+    return [object_names.index(k) for k in names]
+
+__named_signal_index_dispatch__ = {str: __name_index__,
+                                   list: __names_index__,
+                                   tuple: __names_index__}
+
+def __dispatch_handler__(dispatch:dict, obj) -> typing.Optional[typing.Callable]:
+    """Returns the handler for the type of obj in dispatch, or None.
+    Helper for get_index_of_named_signal and get_time_slice
+    
+    The exact type of obj is looked up first; on a miss, the first type in 
+    dispatch that obj is an instance of (e.g. numpy.str_ for str) is used.
+    """
+    handler = dispatch.get(type(obj), None)
+    
+    if handler is None:
+        for t, h in dispatch.items():
+            if isinstance(obj, t):
+                return h
+            
+    return handler
+
 @safeWrapper
 def resample_poly(sig, new_rate, p=1000, window=("kaiser", 5.0)):
     """Resamples signal using a polyphase filtering.
@@ -3206,8 +3245,7 @@ def resample_poly(sig, new_rate, p=1000, window=("kaiser", 5.0)):
     
     return ret
 
-@safeWrapper
-def get_time_slice(data, t0, t1=None, window=0, \
+def __get_time_slice__(data, t0, t1=None, window=0, \
                     segment_index=None, \
                     analogsignal_index=None, \
                     irregularsignal_index=None,\
@@ -3307,7 +3345,6 @@ def get_time_slice(data, t0, t1=None, window=0, \
     From neo version 0.8.0 segments also support time_slicing
     
     """
-    from . import datatypes as dt
     
     # get_time_slice (1) check for t1 first
     
@@ -3373,10 +3410,20 @@ def get_time_slice(data, t0, t1=None, window=0, \
     if isinstance(data, neo.Block): # yes, this function calls itself = recursion
         ret = neo.core.Block()
         if segment_index is None: # get time slice from ALL segments
-            ret.segments = [get_time_slice(seg, t0, t1, 0, analogsignal_index, irregularsignal_index, spiketrain_index, event_index, epoch_index) for seg in data.segments]
+            ret.segments = [__get_time_slice__(seg, t0, t1, 
+                                               analogsignal_index = analogsignal_index, 
+                                               irregularsignal_index = irregularsignal_index, 
+                                               spiketrain_index = spiketrain_index, 
+                                               epoch_index = epoch_index,
+                                               event_index = event_index) for seg in data.segments]
             
         elif isinstance(segment_index, int): # or from just the selected segments
-            ret.segments = [get_time_slice(data.segments[segment_index], t0, t1, analogsignal_index, irregularsignal_index, spiketrain_index, event_index, epoch_index)]
+            ret.segments = [__get_time_slice__(data.segments[segment_index], t0, t1, 
+                                               analogsignal_index = analogsignal_index, 
+                                               irregularsignal_index = irregularsignal_index, 
+                                               spiketrain_index = spiketrain_index, 
+                                               epoch_index = epoch_index,
+                                               event_index = event_index)]
             
         else:
             raise TypeError("Unexpected segment indexing type")
@@ -3389,112 +3436,24 @@ def get_time_slice(data, t0, t1=None, window=0, \
         # time base
         
         # 1) AnalogSignals
-        
         if len(data.analogsignals) > 0:
-            if analogsignal_index is None: # from ALl signals
-                ret.analogsignals = [a.time_slice(t0,t1) for a in data.analogsignals]
-                
-            elif isinstance(analogsignal_index, (str, int)):
-                if isinstance(analogsignal_index,str):
-                    analogsignal_index= get_index_of_named_signal(data, analogsignal_index)
-                
-                ret.analogsignals = [data.analogsignals[analogsignal_index].time_slice(t0,t1)]
-                
-            elif isinstance(analogsignal_index, (list, tuple)):
-                if all([isinstance(s, str) for s in analogsignal_index]):
-                    analogsignal_index = [get_index_of_named_signal(data, s) for s in analogsignal_index]
-                
-                ret.analogsignals = [data.analogsignals[k].time_slice(t0,t1) for k in analogsignal_index]
-                
-            else:
-                raise TypeError("Unexpected analogsignal_index type")
+            ret.analogsignals = __time_slice_collection__(data, analogsignal_index, neo.AnalogSignal, t0, t1)
         
         # 2) IrregularlySampledSignals
-        
         if len(data.irregularlysampledsignals) > 0:
-            if irregularsignal_index is None: # from ALl signals
-                ret.irregularlysampledsignals = [a.time_slice(t0,t1) for a in data.irregularlysampledsignals]
-                
-            elif isinstance(irregularsignal_index, (str, int)):
-                if isinstance(irregularsignal_index,str):
-                    irregularsignal_index = get_index_of_named_signal(data, irregularsignal_index, stype=neo.IrregularlySampledSignal)
-                
-                ret.irregularlysampledsignals = [data.irregularlysampledsignals[irregularsignal_index].time_slice(t0,t1)]
-                
-            elif isinstance(irregularsignal_index, (list, tuple)):
-                if all([isinstance(s, str) for s in irregularsignal_index]):
-                    irregularsignal_index = [get_index_of_named_signal(data, s, stype = neo.IrregularlySampledSignal) for s in irregularsignal_index]
-                
-                ret.irregularlysampledsignals = [data.irregularlysampledsignals[k].time_slice(t0,t1) for k in irregularsignal_index]
-                
-            else:
-                raise TypeError("Unexpected irregularsignal_index index type")
-            
+            ret.irregularlysampledsignals = __time_slice_collection__(data, irregularsignal_index, neo.IrregularlySampledSignal, t0, t1)
             
         # 3) Spike trains
-        
         if len(data.spiketrains) > 0:
-            if spiketrain_index is None: # ALL spike trains
-                ret.spiketrains = [a.time_slice(t0, t1) for a in data.spiketrains]
-                
-            elif isinstance(spiketrain_index, (str, int)):
-                if isinstance(spiketrain_index, str):
-                    spiketrain_index = get_index_of_named_signal(data, spiketrain_index, stype=neo.SpikeTrain)
-                    
-                ret.spiketrains = [data.spiketrains[spiketrain_index].time_slice(t0,t1)]
-                
-            elif isinstance(spiketrain_index, (list, tuple)):
-                if all([isinstance(s, str) for s in spiketrain_index]):
-                    spiketrain_index = [get_index_of_named_signal(data, s, stype=neo.SpikeTrain) for s in spiketrain_index]
-                    
-                ret.spiketrains = [data.spiketrains[k].time_slice(t0,t1) for k in spiketrain_index]
-                
-            else:
-                raise TypeError("Unexpected spiketrain index type")
-            
+            ret.spiketrains = __time_slice_collection__(data, spiketrain_index, neo.SpikeTrain, t0, t1)
                 
         # 4) Event
-        
         if len(data.events) > 0:
-            if event_index is None:
-                ret.events = [e.time_slice(t0, t1) for e in data.events]
-                
-            elif isinstance(event_index, (str, int)):
-                if isinstance(event_index, str):
-                    event_index = get_index_of_named_signal(data, event_index, stype=neo.Event)
-                    
-                ret.event = [data.events[event_index].time_slice(t0,t1)]
-                
-            elif isinstance(event_index, (tuple, list)):
-                if all([isinstance(s, str) for s in event_index]):
-                    event_index = [get_index_of_named_signal(data, s, stype=neo.Event) for s in event_index]
-                    
-                ret.events = [data.events[k].time_slice(t0, t1) for k in event_index]
-                
-            else:
-                raise TypeError("Unexpected event index type")
-            
+            ret.events = __time_slice_collection__(data, event_index, neo.Event, t0, t1)
                 
         # 5) Epoch
-        
         if len(data.epochs) > 0:
-            if epoch_index is None:
-                ret.epochs = [e.time_slice(t0, t1) for e in data.epochs]
-                
-            elif isinstance(epoch_index, (str, int)):
-                if isinstance(epoch_index, str):
-                    event_index = get_index_of_named_signal(data, epoch_index, stype=neo.Event)
-                    
-                ret.event = [data.epochs[epoch_index].time_slice(t0,t1)]
-                
-            elif isinstance(epoch_index, (tuple, list)):
-                if all([isinstance(s, str) for s in epoch_index]):
-                    epoch_index = [get_index_of_named_signal(data, s, stype=neo.Event) for s in epoch_index]
-                    
-                ret.epochs = [data.epochs[k].time_slice(t0, t1) for k in epoch_index]
-                
-            else:
-                raise TypeError("Unexpected epoch index type")
+            ret.epochs = __time_slice_collection__(data, epoch_index, neo.Epoch, t0, t1)
         
     elif isinstance(data, (neo.AnalogSignal, DataSignal)):
         return data.time_slice(t0,t1)
@@ -3516,8 +3475,44 @@ def get_time_slice(data, t0, t1=None, window=0, \
         
     return ret
 
-@safeWrapper
-def concatenate_signals(*args, axis=1, ignore_domain = False, ignore_units=False):
+# NOTE: the undecorated function is used in recursive calls, to avoid the 
+# overhead of safeWrapper for each segment
+get_time_slice = safeWrapper(__get_time_slice__)
+
+def __time_slice_all__(data, objects, index, stype, t0, t1):
+    return [o.time_slice(t0, t1) for o in objects]
+
+def __time_slice_by_name__(data, objects, index, stype, t0, t1):
+    return [objects[get_index_of_named_signal(data, index, stype=stype)].time_slice(t0, t1)]
+
+def __time_slice_by_int__(data, objects, index, stype, t0, t1):
+    return [objects[index].time_slice(t0, t1)]
+
+def __time_slice_by_seq__(data, objects, index, stype, t0, t1):
+    if all([isinstance(s, str) for s in index]):
+        index = [get_index_of_named_signal(data, s, stype=stype) for s in index]
+        
+    return [objects[k].time_slice(t0, t1) for k in index]
+
+# NOTE: see __dispatch_handler__ for how the index type is looked up
+__time_slice_dispatch__ = {type(None):  __time_slice_all__,
+                           str:         __time_slice_by_name__,
+                           int:         __time_slice_by_int__,
+                           list:        __time_slice_by_seq__,
+                           tuple:       __time_slice_by_seq__}
+
+def __time_slice_collection__(data:neo.Segment, index, stype, t0, t1) -> list:
+    """Time slices of the data objects of type 'stype' selected by 'index'.
+    Helper for get_time_slice
+    """
+    handler = __dispatch_handler__(__time_slice_dispatch__, index)
+    
+    if handler is None:
+        raise TypeError("Unexpected %s index type: %s" % (stype.__name__, type(index).__name__))
+    
+    return handler(data, getattr(data, "%ss" % stype.__name__.lower()), index, stype, t0, t1)
+
+def __concatenate_signals__(*args, axis=1, ignore_domain = False, ignore_units=False):
     """Concatenates regularly sampled signals.
     
     Var-positional parameters:
@@ -3545,7 +3540,6 @@ def concatenate_signals(*args, axis=1, ignore_domain = False, ignore_units=False
         When True, will skip checks for units compatibilty among signals.
     
     """
-    from . import datatypes as dt
     
     if len(args) == 1:
         if isinstance(args[0], (tuple, list)):
@@ -3579,14 +3573,22 @@ def concatenate_signals(*args, axis=1, ignore_domain = False, ignore_units=False
                 
         # this is needed for any concatenation axis!
         if not ignore_domain:
-            if not all([np.isclose(sig.sampling_rate.magnitude, signals[0].sampling_rate.magnitude) for sig in signals[1:]]):
+            srs = np.fromiter((sig.sampling_rate.magnitude for sig in signals), dtype=float, count=len(signals))
+            
+            if not np.allclose(srs, srs[0]):
                 raise ValueError("To concatenate signals on the 2nd dimension they must all have the same sampling rate")
             
-            if not all([sig.times.units] == signals[0].times.units for sig in signals[1:]):
+            u0_times = signals[0].times.units
+            
+            if not all(sig.times.units == u0_times for sig in signals[1:]):
                 raise ValueError("To concatenate signals on 2nd dimension they must have identical domain units ")
             
         if not ignore_units:
-            if not all([dt.units_convertible(sig.units, signals[0].units) for sig in signals[1:]]):
+            # NOTE: compare units directly first (the common case) and only fall
+            # back on dimensionality analysis when they differ
+            u0 = signals[0].units
+            
+            if not all((sig.units == u0) or dt.units_convertible(sig.units, u0) for sig in signals[1:]):
                 warnings.warn("There are signals with non-convertible units; this may become an error in the future")
             
         if ignore_domain:
@@ -3621,6 +3623,194 @@ def concatenate_signals(*args, axis=1, ignore_domain = False, ignore_units=False
     else:
         raise TypeError("Expecting a sequence of neo.AnalogSignal or datatypes.DataSignal objects")
                 
+# NOTE: use the undecorated function when called from within this module
+concatenate_signals = safeWrapper(__concatenate_signals__)
+
+def __segment_copy__(seg: neo.Segment, name=None, copy_signals=False, 
+                     **annotations) -> neo.Segment:
+    """Returns a new neo.Segment with the data objects of 'seg'.
+    Helper for concatenate_blocks and concatenate_blocks2
+    
+    name: str or None; when given, it replaces the name of 'seg'
+    
+    copy_signals: bool, default False
+        When True, the signals, spike trains, epochs and events of 'seg' are
+        copied.
+        
+        When False, the new segment has its own containers (lists) but these
+        hold references to the data objects of 'seg': no data is copied.
+        
+        CAUTION: in this case, in-place modifications of the data in the 
+        returned segment will affect the source segment.
+    
+    annotations: added to (or replacing) the annotations of 'seg', in the 
+        new segment
+    
+    The metadata and annotations are set in the neo.Segment constructor.
+    """
+    seg_annotations = seg.annotations.copy()
+    seg_annotations.update(annotations)
+    
+    ret = neo.Segment(name = seg.name if name is None else name, 
+                      description = seg.description,
+                      file_origin = seg.file_origin,
+                      file_datetime = seg.file_datetime,
+                      rec_datetime = seg.rec_datetime,
+                      index = seg.index,
+                      **seg_annotations)
+    
+    if copy_signals:
+        cp = lambda objects: [o.copy() for o in objects]
+        
+    else:
+        cp = list
+    
+    ret.analogsignals = cp(seg.analogsignals)
+    ret.irregularlysampledsignals = cp(seg.irregularlysampledsignals)
+    ret.spiketrains = cp(seg.spiketrains)
+    ret.epochs = cp(seg.epochs)
+    ret.events = cp(seg.events)
+    
+    if copy_signals:
+        ret.create_many_to_one_relationship()
+    
+    return ret
+
+def __shallow_signal_copy__(sig):
+    """Returns a new signal object that shares the data buffer of 'sig'.
+    
+    The new signal has its own metadata (including a copy of the annotations
+    dictionary) but the samples are NOT copied: in-place modifications of 
+    the samples of either signal affect the other.
+    """
+    ret = sig.view(type(sig))
+    ret.annotations = sig.annotations.copy()
+    
+    return ret
+
+def __signal_name_map__(signals:typing.Sequence) -> dict:
+    """Maps signal names to the index of the first signal with that name.
+    """
+    ret = dict()
+    
+    for k, sig in enumerate(signals):
+        ret.setdefault(sig.name, k)
+        
+    return ret
+
+def __resolve_signal_indices__(signals:typing.Sequence, analog_index) -> list:
+    """Resolves analog_index to a list of int indices into 'signals'.
+    Helper for __analog_signal_selector__
+    
+    analog_index: int, str (signal name) or a sequence (tuple, list) of int 
+        or str; the type of its elements is NOT checked here.
+        
+    Raises ValueError when a signal name is not found in 'signals'.
+    """
+    t = type(analog_index)
+    
+    # NOTE: exact type checks first; isinstance also accepts subclasses 
+    # (e.g. numpy.str_)
+    if t is str or isinstance(analog_index, str):
+        return [__name_index__(signals, analog_index, False)]
+    
+    if t is int or isinstance(analog_index, int):
+        return [analog_index]
+    
+    # NOTE: resolve all signal names in one pass through the signals
+    names = __signal_name_map__(signals)
+    
+    ret = list()
+    append = ret.append
+    
+    for k in analog_index:
+        if isinstance(k, str):
+            if k not in names:
+                raise ValueError("No signal named %s was found" % k)
+            
+            append(names[k])
+            
+        else:
+            append(k)
+            
+    return ret
+
+def __analog_signal_selector__(analog_index, copy_signals=True) -> typing.Callable:
+    """Returns a function that selects analog signals from a segment.
+    Helper for concatenate_blocks and concatenate_blocks2
+    
+    analog_index: int, str (signal name) or a sequence (tuple, list) of int 
+        or str
+        
+    copy_signals: bool, default True; when False, the selected signals share
+        their data with the signals in the segment 
+        (see __shallow_signal_copy__)
+        
+    The returned function takes a neo.Segment and returns a list with copies
+    of the analog signals selected by analog_index. The type of analog_index 
+    is checked here, once, and not for each segment.
+    
+    Signal names are resolved to int indices for each segment (the position
+    of a named signal may differ across segments); int indices are resolved
+    only once.
+    """
+    cp = (lambda sig: sig.copy()) if copy_signals else __shallow_signal_copy__
+    
+    # NOTE: the exact type checks are the fast path; isinstance also accepts
+    # subclasses (e.g. numpy.str_), as before
+    t = type(analog_index)
+    
+    is_str = t is str or isinstance(analog_index, str)
+    
+    is_int = t is int or (not is_str and isinstance(analog_index, int))
+    
+    if not is_str and not is_int:
+        if not isinstance(analog_index, (tuple, list)):
+            raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % t.__name__)
+        
+        for sigNdx in analog_index:
+            if type(sigNdx) is not int and type(sigNdx) is not str and not isinstance(sigNdx, (str, int)):
+                raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
+            
+    if is_int or (not is_str and all(type(sigNdx) is int or isinstance(sigNdx, int) for sigNdx in analog_index)):
+        indices = [analog_index] if is_int else list(analog_index)
+        
+        def __select__(seg):
+            signals = seg.analogsignals
+            return [cp(signals[k]) for k in indices]
+        
+        return __select__
+    
+    # NOTE: bind global lookup to a (closure) local
+    resolve = __resolve_signal_indices__
+    
+    def __select__(seg):
+        signals = seg.analogsignals
+        return [cp(signals[k]) for k in resolve(signals, analog_index)]
+    
+    return __select__
+
+def __new_segment__(seg:neo.Segment, origin, original_segment, name=None, 
+                    analogsignals=()) -> neo.Segment:
+    """Returns a new neo.Segment with the metadata of 'seg'.
+    Helper for concatenate_blocks and concatenate_blocks2
+    
+    The new segment has the rec_datetime and the annotations of 'seg', and
+    is further annotated with 'origin' and 'original_segment'.
+    
+    The new segment contains the signals in 'analogsignals' (by default, 
+    none).
+    """
+    # NOTE: build the annotations here and pass them to the constructor, once
+    seg_annotations = seg.annotations.copy()
+    seg_annotations["origin"] = origin
+    seg_annotations["original_segment"] = original_segment
+    
+    seg_ = neo.Segment(rec_datetime = seg.rec_datetime, name=name, 
+                       **seg_annotations)
+    seg_.analogsignals.extend(analogsignals)
+    
+    return seg_
 
 @safeWrapper
 def concatenate_blocks(*args, **kwargs):
@@ -3674,6 +3864,17 @@ def concatenate_blocks(*args, **kwargs):
                 
     channel:    int, index  of the neo.ChannelIndex
                     
+    copy_signals: bool, default is False
+                When False, and all signals are to be retained (i.e. 'analog'
+                is None) the segments of the concatenated Block hold 
+                references to the data objects in the source segments; when
+                a subset of analog signals is selected, these share their 
+                data buffers with the source signals.
+                
+                CAUTION: in this case, in-place modifications of the signals
+                in the concatenated Block will affect the source data.
+                
+                When True, the data objects are copied.
                     
     Returns:
     -------
@@ -3692,10 +3893,6 @@ def concatenate_blocks(*args, **kwargs):
 
     
     """
-    major, minor, dot = get_neo_version()
-    
-    neo_ge_8 = any([major >=0, minor >= 8])
-    
     #if not isinstance(arg0, (neo.core.Block, neo.core.Segment)):
         #raise TypeError("First argument must be a Block or a Segment")
         
@@ -3726,50 +3923,74 @@ def concatenate_blocks(*args, **kwargs):
     irregular_index = kwargs.get("irregular", None)
     image_index = kwargs.get("image", None)
     channel_index = kwargs.get("channel", None)
+    copy_signals = kwargs.get("copy_signals", False)
+    
+    if analog_index is not None:
+        select_signals = __analog_signal_selector__(analog_index, copy_signals)
     
      # the returned data:
     ret = neo.core.Block(name=name, description=description, file_origin=file_origin,
                          file_datetime=file_datetime, rec_datetime=rec_datetime, 
                          **annotations)
     
-    if isinstance(args, neo.core.Block):
-        if segment_index is None:
-            for (l,seg) in enumerate(args.segments):
+    # NOTE: local bindings for the helpers called for each segment
+    new_segment = __new_segment__
+    segment_copy = __segment_copy__
+    
+    # NOTE: a sequence of blocks is the common case; check the exact type of
+    # args first
+    t = type(args)
+    
+    if t is list or t is tuple or isinstance(args, (tuple, list)):
+        append = ret.segments.append
+        
+        for (k,arg) in enumerate(args):
+            if type(arg) is neo.core.Block or isinstance(arg, neo.core.Block):
+                if segment_index is None:
+                    if analog_index is None:
+                        for seg in arg.segments:
+                            seg.annotate(origin=arg.file_origin, original_segment=segment_index)
+                            append(seg)
+                            
+                    else:
+                        ret.segments.extend([new_segment(seg, arg.file_origin, segment_index,
+                                                         analogsignals=select_signals(seg)) for seg in arg.segments])
+                            
+                else:
+                    if segment_index < len(arg.segments):
+                        seg = arg.segments[segment_index]
+                        
+                        if analog_index is None:
+                            seg.annotate(origin=arg.file_origin, original_segment=segment_index)
+                            append(seg)
+                            
+                        else:
+                            append(new_segment(seg, arg.file_origin, segment_index, 
+                                               analogsignals=select_signals(seg)))
+        
+            elif type(arg) is neo.core.Segment or isinstance(arg, neo.core.Segment):
                 if analog_index is None:
-                    #seg_ = copy(seg)
-                    seg_ = neo_copy(seg)
-                    seg_.name = "%s_%s" % (args.name, seg.name)
-                    seg_.annotate(origin=args.file_origin, original_segment=segment_index)
-                    ret.segments.append(seg_)
+                    append(arg)
                     
                 else:
-                    # NOTE: 2020-03-13 08:48:10 
-                    # we do NOT copy; instead we create a new segment, that we
-                    # then populate with selected signals
-                    seg_ = neo.Segment(rec_datetime = seg.rec_datetime, name="%s_%s" % (args.name, seg.name))
-                    seg_.merge_annotations(seg)
-                    seg_.annotate(origin=args.file_origin, original_segment=segment_index)
+                    append(new_segment(arg, arg.file_origin, segment_index,
+                                       analogsignals=select_signals(arg)))
+                    
+    elif isinstance(args, neo.core.Block):
+        if segment_index is None:
+            if analog_index is None:
+                ret.segments.extend([segment_copy(seg, "%s_%s" % (args.name, seg.name), copy_signals,
+                                                  origin=args.file_origin, 
+                                                  original_segment=segment_index) for seg in args.segments])
+                    
+            else:
+                # NOTE: 2020-03-13 08:48:10 
+                # we do NOT copy; instead we create a new segment, that we
+                # then populate with selected signals
+                ret.segments.extend([new_segment(seg, args.file_origin, segment_index, 
+                                                 name="%s_%s" % (args.name, seg.name),
+                                                 analogsignals=select_signals(seg)) for seg in args.segments])
                     
-                    if isinstance(analog_index, str):
-                        seg_.analogsignals.append(seg.analogsignals[get_index_of_named_signal(seg, analog_index)].copy())
-                        
-                    elif isinstance(analog_index, int):
-                        seg_.analogsignals.append(seg.analogsignals[analog_index].copy())
-                        
-                    elif isinstance(analog_index, (tuple, list)):
-                        for sigNdx in analog_index:
-                            if isinstance(sigNdx, str):
-                                sigNdx = get_index_of_named_signal(seg, sigNdx)
-                                
-                            elif not isinstance(sigNdx, int):
-                                raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                
-                            seg_.analogsignals.append(seg.analogsignals[sigNdx].copy())
-                            
-                    else:
-                        raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                        
-                    ret.segments.append(seg_)
         else:
             if segment_index < len(args.segments):
                 # NOTE: 2020-03-13 08:51:32
@@ -3780,183 +4001,61 @@ def concatenate_blocks(*args, **kwargs):
                 seg = args.segments[segment_index] # a reference
                 
                 if analog_index is None:
-                    seg_ = copy(seg)
-                    seg_.name = "%s_%s" % (args.name, seg.name)
-                    seg_.annotate(origin=args.file_origin, original_segment=segment_index)
-                    ret.segments.append(seg_) # copy of original seg
+                    ret.segments.append(segment_copy(seg, "%s_%s" % (args.name, seg.name), copy_signals,
+                                                     origin=args.file_origin, 
+                                                     original_segment=segment_index))
                     
                 else:
-                    seg_ = neo.Segment(rec_datetime = seg.rec_datetime, name="%s_%s" % (args.name, seg.name)) # new seg
-                    seg_.merge_annotations(seg)
-                    seg_.annotate(origin=args.file_origin, original_segment=segment_index)
+                    ret.segments.append(new_segment(seg, args.file_origin, segment_index, 
+                                                    name="%s_%s" % (args.name, seg.name),
+                                                    analogsignals=select_signals(seg)))
+        
+    else:
+        raise TypeError("Expecting a neo.Block or a sequence of neo.Block objects, got %s instead" % type(args).__name__)
+            
+    return ret
+
+@safeWrapper
+def concatenate_blocks2(*args, **kwargs):
+    """Concatenates the segments in *args into a new Block.
+    
+    Copies of neo.Segment objects in the source data (*args) are appended in the
+    order they are encountered.
+    
+    Optionally a subset of the signals contained in the source data are retained
+    in the concatenated Block.
+    
+    Events, spike trains and epochs contained in the selected segments will be
+    copied to the concatenated Block.
+    
+    Var-positional parameters:
+    --------------------------
+    args : a comma-separated list of neo.core.Block or neo.core.Segment objects
+    
+    Var-keyword parameters:
+    -----------------------
+    
+    name            see neo.Block docstring
+    description     see neo.Block docstring
+    rec_datetime    see neo.Block docstring
+    file_origin     see neo.Block docstring
+    file_datetime   see neo.Block docstring
+    annotation      see neo.Block docstring
+    
+    segment:    int or None; 
+                when None, all segments in each block will be used
+                when int then only segments with given index will be used
+                (i.e. only one segment from each block will be retained in 
+                the concatenated data)
                     
-                    analog_index = neo_index_lookup(seg, analog_index, )
-                    
-                    if isinstance(analog_index, str):
-                        seg_.analogsignals.append(seg.analogsignals[get_index_of_named_signal(seg, analog_index)].copy())
-                        
-                    elif isinstance(analog_index, int):
-                        seg_.analogsignals.append(seg.analogsignals[analog_index].copy())
-                        
-                    elif isinstance(analog_index, (tuple, list)):
-                        for sigNdx in analog_index:
-                            if isinstance(sigNdx, str):
-                                sigNdx = get_index_of_named_signal(seg, sigNdx)
-                                
-                            elif not isinstance(sigNdx, int):
-                                raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                
-                            seg_.analogsignals.append(seg.analogsignals[sigNdx].copy())
-                            
-                    else:
-                        raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                        
-                    ret.segments.append(seg_)
-        
-    elif isinstance(args,(tuple, list)):
-        for (k,arg) in enumerate(args):
-            if isinstance(arg, neo.core.Block):
-                if segment_index is None:
-                    for (l,seg) in enumerate(arg.segments):
-                        if analog_index is None:
-                            ret.segments.append(seg)
-                            ret.segments[-1].annotate(origin=arg.file_origin, original_segment=segment_index)
-                            
-                        else:
-                            seg_ = neo.Segment(rec_datetime = seg.rec_datetime)
-                            seg_.annotate(origin=arg.file_origin, original_segment=segment_index)
-                            
-                            if isinstance(analog_index, str):
-                                seg_.analogsignals.append(seg.analogsignals[get_index_of_named_signal(seg, analog_index)].copy())
-                                
-                            elif isinstance(analog_index, int):
-                                seg_.analogsignals.append(seg.analogsignals[analog_index].copy())
-                                
-                            elif isinstance(analog_index, (tuple, list)):
-                                for sigNdx in analog_index:
-                                    if isinstance(sigNdx, str):
-                                        sigNdx = get_index_of_named_signal(seg, sigNdx)
-                                        
-                                    elif not isinstance(sigNdx, int):
-                                        raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                        
-                                    seg_.analogsignals.append(seg.analogsignals[sigNdx].copy())
-                                    
-                            else:
-                                raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                                
-                            ret.segments.append(seg_)
-        
-                            
-                else:
-                    if segment_index < len(arg.segments):
-                        if analog_index is None:
-                            ret.segments.append(arg.segments[segment_index])
-                            ret.segments[-1].annotate(origin=arg.file_origin, original_segment=segment_index)
-                            
-                        else:
-                            seg = arg.segments[segment_index]
-                            
-                            seg_ = neo.Segment(rec_datetime = seg.rec_datetime)
-                            seg_.annotate(origin=arg.file_origin, original_segment=segment_index)
-                            
-                            if isinstance(analog_index, str):
-                                seg_.analogsignals.append(seg.analogsignals[get_index_of_named_signal(seg, analog_index)].copy())
-                                
-                            elif isinstance(analog_index, int):
-                                seg_.analogsignals.append(seg.analogsignals[analog_index].copy())
-                                
-                            elif isinstance(analog_index, (tuple, list)):
-                                for sigNdx in analog_index:
-                                    if isinstance(sigNdx, str):
-                                        sigNdx = get_index_of_named_signal(seg, sigNdx)
-                                        
-                                    elif not isinstance(sigNdx, int):
-                                        raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                        
-                                    seg_.analogsignals.append(seg.analogsignals[sigNdx].copy())
-                                    
-                            else:
-                                raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                                
-                            ret.segments.append(seg_)
-        
-            elif isinstance(arg, neo.core.Segment):
-                if analog_index is None:
-                    ret.segments.append(arg)
-                    
-                else:
-                    seg_ = neo.Segment(rec_datetime = arg.rec_datetime)
-                    seg_.annotate(origin=arg.file_origin, original_segment=segment_index)
-                    
-                    if isinstance(analog_index, str):
-                        seg_.analogsignals.append(arg.analogsignals[get_index_of_named_signal(arg, analog_index)].copy())
-                        
-                    elif isinstance(analog_index, int):
-                        seg_.analogsignals.append(arg.analogsignals[analog_index].copy())
-                        
-                    elif isinstance(analog_index, (tuple, list)):
-                        for sigNdx in analog_index:
-                            if isinstance(sigNdx, str):
-                                sigNdx = get_index_of_named_signal(arg, sigNdx)
-                                
-                            elif not isinstance(sigNdx, int):
-                                raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                
-                            seg_.analogsignals.append(arg.analogsignals[sigNdx].copy())
-                            
-                    else:
-                        raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                        
-                    ret.segments.append(seg_)
-        
-                    
-    else:
-        raise TypeError("Expecting a neo.Block or a sequence of neo.Block objects, got %s instead" % type(args).__name__)
-            
-    return ret
-
-@safeWrapper
-def concatenate_blocks2(*args, **kwargs):
-    """Concatenates the segments in *args into a new Block.
-    
-    Copies of neo.Segment objects in the source data (*args) are appended in the
-    order they are encountered.
-    
-    Optionally a subset of the signals contained in the source data are retained
-    in the concatenated Block.
-    
-    Events, spike trains and epochs contained in the selected segments will be
-    copied to the concatenated Block.
-    
-    Var-positional parameters:
-    --------------------------
-    args : a comma-separated list of neo.core.Block or neo.core.Segment objects
-    
-    Var-keyword parameters:
-    -----------------------
-    
-    name            see neo.Block docstring
-    description     see neo.Block docstring
-    rec_datetime    see neo.Block docstring
-    file_origin     see neo.Block docstring
-    file_datetime   see neo.Block docstring
-    annotation      see neo.Block docstring
-    
-    segment:    int or None; 
-                when None, all segments in each block will be used
-                when int then only segments with given index will be used
-                (i.e. only one segment from each block will be retained in 
-                the concatenated data)
-                    
-    analog:     int, str, range, slice, typing.Sequence
-                Indexing of analog signal(s) into each of the segments, that
-                will be retained in the concatenated data. These include
-                neo.AnalogSignal and datatypes.DataSignal
-                
-                This index can be (see neo_index_lookup):
-                int, str (signal name), sequence of int or str, a range, a
-                slice, or a numpy array of int or booleans.
+    analog:     int, str, range, slice, typing.Sequence
+                Indexing of analog signal(s) into each of the segments, that
+                will be retained in the concatenated data. These include
+                neo.AnalogSignal and datatypes.DataSignal
+                
+                This index can be (see neo_index_lookup):
+                int, str (signal name), sequence of int or str, a range, a
+                slice, or a numpy array of int or booleans.
                     
     irregular:  as analog, for irregularly sampled signals. These 
                 include neo.IrregularlySampledSignal and 
@@ -3968,6 +4067,14 @@ def concatenate_blocks2(*args, **kwargs):
                 
     channel:    int, index  of the neo.ChannelIndex
                     
+    copy_signals: bool, default is False
+                When False, the selected analog signals share their data 
+                buffers with the source signals.
+                
+                CAUTION: in this case, in-place modifications of these 
+                signals in the concatenated Block will affect the source data.
+                
+                When True, the selected analog signals are copied.
                     
     Returns:
     -------
@@ -3986,10 +4093,6 @@ def concatenate_blocks2(*args, **kwargs):
 
     
     """
-    major, minor, dot = get_neo_version()
-    
-    neo_ge_8 = any([major >=0, minor >= 8])
-    
     #if not isinstance(arg0, (neo.core.Block, neo.core.Segment)):
         #raise TypeError("First argument must be a Block or a Segment")
         
@@ -4020,6 +4123,10 @@ def concatenate_blocks2(*args, **kwargs):
     irregular_index = kwargs.get("irregular", None)
     image_index = kwargs.get("image", None)
     channel_index = kwargs.get("channel", None)
+    copy_signals = kwargs.get("copy_signals", False)
+    
+    if analog_index is not None:
+        select_signals = __analog_signal_selector__(analog_index, copy_signals)
     
      # the returned data:
     ret = neo.core.Block(name=name, description=description, file_origin=file_origin,
@@ -4028,50 +4135,67 @@ def concatenate_blocks2(*args, **kwargs):
     
     #print(len(args))
     
-    if isinstance(args, neo.core.Block):
-        if segment_index is None:
-            for (l,seg) in enumerate(args.segments):
+    # NOTE: local bindings for the helpers called for each segment
+    new_segment = __new_segment__
+    segment_copy = __segment_copy__
+    
+    # NOTE: a sequence of blocks is the common case; check the exact type of
+    # args first
+    t = type(args)
+    
+    if t is list or t is tuple or isinstance(args, (tuple, list)):
+        append = ret.segments.append
+        
+        for (k,arg) in enumerate(args):
+            if type(arg) is neo.core.Block or isinstance(arg, neo.core.Block):
+                if segment_index is None:
+                    # NOTE: copy the segments only when all their signals are
+                    # retained
+                    if analog_index is None:
+                        ret.segments.extend([segment_copy(seg, None, True,
+                                                          origin=arg.file_origin,
+                                                          original_segment=segment_index) for seg in arg.segments])
+                            
+                    else:
+                        ret.segments.extend([new_segment(seg, arg.file_origin, segment_index,
+                                                         analogsignals=select_signals(seg)) for seg in arg.segments])
+                            
+                else:
+                    if segment_index < len(arg.segments):
+                        seg = arg.segments[segment_index]
+                        
+                        if analog_index is None:
+                            append(segment_copy(seg, None, True,
+                                                origin=arg.file_origin,
+                                                original_segment=segment_index))
+                            
+                        else:
+                            append(new_segment(seg, arg.file_origin, segment_index,
+                                               analogsignals=select_signals(seg)))
+        
+            elif type(arg) is neo.core.Segment or isinstance(arg, neo.core.Segment):
                 if analog_index is None:
-                    #seg_ = copy(seg)
-                    seg_ = neo_copy(seg)
-                    seg_.name = "%s_%s" % (args.name, seg.name)
-                    seg_.annotate(origin=args.file_origin, original_segment=segment_index)
-                    ret.segments.append(seg_)
+                    append(arg)
                     
                 else:
-                    # NOTE: 2020-03-13 08:48:10 
-                    # we do NOT copy; instead we create a new segment, that we
-                    # then populate with selected signals
-                    seg_ = neo.Segment(rec_datetime = seg.rec_datetime, name="%s_%s" % (args.name, seg.name))
+                    append(new_segment(arg, arg.file_origin, segment_index,
+                                       analogsignals=select_signals(arg)))
                     
-                    seg_.merge_annotations(seg)
-                    
-                    seg_.annotate(origin=args.file_origin, original_segment=segment_index)
-                    
-                    signal_index = neo_index_lookup(seg, analog_index)
+    elif isinstance(args, neo.core.Block):
+        if segment_index is None:
+            if analog_index is None:
+                ret.segments.extend([segment_copy(seg, "%s_%s" % (args.name, seg.name), True,
+                                                  origin=args.file_origin, 
+                                                  original_segment=segment_index) for seg in args.segments])
                     
-                    sig_ = seg.analogsignals[signal_index]
+            else:
+                # NOTE: 2020-03-13 08:48:10 
+                # we do NOT copy; instead we create a new segment, that we
+                # then populate with selected signals
+                ret.segments.extend([new_segment(seg, args.file_origin, segment_index, 
+                                                 name="%s_%s" % (args.name, seg.name),
+                                                 analogsignals=select_signals(seg)) for seg in args.segments])
                     
-                    #if isinstance(analog_index, str):
-                        #seg_.analogsignals.append(seg.analogsignals[get_index_of_named_signal(seg, analog_index)].copy())
-                        
-                    #elif isinstance(analog_index, int):
-                        #seg_.analogsignals.append(seg.analogsignals[analog_index].copy())
-                        
-                    #elif isinstance(analog_index, (tuple, list)):
-                        #for sigNdx in analog_index:
-                            #if isinstance(sigNdx, str):
-                                #sigNdx = get_index_of_named_signal(seg, sigNdx)
-                                
-                            #elif not isinstance(sigNdx, int):
-                                #raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                
-                            #seg_.analogsignals.append(seg.analogsignals[sigNdx].copy())
-                            
-                    #else:
-                        #raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                        
-                    ret.segments.append(seg_)
         else:
             if segment_index < len(args.segments):
                 # NOTE: 2020-03-13 08:51:32
@@ -4082,146 +4206,26 @@ def concatenate_blocks2(*args, **kwargs):
                 seg = args.segments[segment_index] # a reference
                 
                 if analog_index is None:
-                    seg_ = copy(seg)
-                    seg_.name = "%s_%s" % (args.name, seg.name)
-                    seg_.annotate(origin=args.file_origin, original_segment=segment_index)
-                    ret.segments.append(seg_) # copy of original seg
+                    # NOTE: copy of the original segment (and its data)
+                    ret.segments.append(segment_copy(seg, "%s_%s" % (args.name, seg.name), True,
+                                                     origin=args.file_origin, 
+                                                     original_segment=segment_index))
                     
                 else:
-                    seg_ = neo.Segment(rec_datetime = seg.rec_datetime, name="%s_%s" % (args.name, seg.name)) # new seg
-                    seg_.merge_annotations(seg)
-                    seg_.annotate(origin=args.file_origin, original_segment=segment_index)
-                    
-                    analog_index = neo_index_lookup(seg, analog_index, )
-                    
-                    if isinstance(analog_index, str):
-                        seg_.analogsignals.append(seg.analogsignals[get_index_of_named_signal(seg, analog_index)].copy())
-                        
-                    elif isinstance(analog_index, int):
-                        seg_.analogsignals.append(seg.analogsignals[analog_index].copy())
-                        
-                    elif isinstance(analog_index, (tuple, list)):
-                        for sigNdx in analog_index:
-                            if isinstance(sigNdx, str):
-                                sigNdx = get_index_of_named_signal(seg, sigNdx)
-                                
-                            elif not isinstance(sigNdx, int):
-                                raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                
-                            seg_.analogsignals.append(seg.analogsignals[sigNdx].copy())
-                            
-                    else:
-                        raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                        
-                    ret.segments.append(seg_)
+                    ret.segments.append(new_segment(seg, args.file_origin, segment_index, 
+                                                    name="%s_%s" % (args.name, seg.name),
+                                                    analogsignals=select_signals(seg)))
         
-    elif isinstance(args,(tuple, list)):
-        for (k,arg) in enumerate(args):
-            if isinstance(arg, neo.core.Block):
-                if segment_index is None:
-                    for (l,seg) in enumerate(arg.segments):
-                        seg_ = neo_copy(seg)
-                        if analog_index is None:
-                            seg_.annotate(origin=arg.file_origin, original_segment=segment_index)
-                            ret.segments.append(seg_)
-                            
-                        else:
-                            seg_ = neo.Segment(rec_datetime = seg.rec_datetime)
-                            seg_.annotate(origin=arg.file_origin, original_segment=segment_index)
-                            
-                            if isinstance(analog_index, str):
-                                seg_.analogsignals.append(seg.analogsignals[get_index_of_named_signal(seg, analog_index)].copy())
-                                
-                            elif isinstance(analog_index, int):
-                                seg_.analogsignals.append(seg.analogsignals[analog_index].copy())
-                                
-                            elif isinstance(analog_index, (tuple, list)):
-                                for sigNdx in analog_index:
-                                    if isinstance(sigNdx, str):
-                                        sigNdx = get_index_of_named_signal(seg, sigNdx)
-                                        
-                                    elif not isinstance(sigNdx, int):
-                                        raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                        
-                                    seg_.analogsignals.append(seg.analogsignals[sigNdx].copy())
-                                    
-                            else:
-                                raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                                
-                            ret.segments.append(seg_)
-        
-                            
-                else:
-                    if segment_index < len(arg.segments):
-                        if analog_index is None:
-                            seg_ = neo_copy(arg.segments[segment_index])
-                            seg_.annotate(origin=arg.file_origin, original_segment=segment_index)
-                            ret.segments.append(seg_)
-                            #ret.segments.append(arg.segments[segment_index])
-                            #ret.segments[-1].annotate(origin=arg.file_origin, original_segment=segment_index)
-                            
-                        else:
-                            seg = arg.segments[segment_index]
-                            
-                            seg_ = neo.Segment(rec_datetime = seg.rec_datetime)
-                            seg_.annotate(origin=arg.file_origin, original_segment=segment_index)
-                            
-                            if isinstance(analog_index, str):
-                                seg_.analogsignals.append(seg.analogsignals[get_index_of_named_signal(seg, analog_index)].copy())
-                                
-                            elif isinstance(analog_index, int):
-                                seg_.analogsignals.append(seg.analogsignals[analog_index].copy())
-                                
-                            elif isinstance(analog_index, (tuple, list)):
-                                for sigNdx in analog_index:
-                                    if isinstance(sigNdx, str):
-                                        sigNdx = get_index_of_named_signal(seg, sigNdx)
-                                        
-                                    elif not isinstance(sigNdx, int):
-                                        raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                        
-                                    seg_.analogsignals.append(seg.analogsignals[sigNdx].copy())
-                                    
-                            else:
-                                raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                                
-                            ret.segments.append(seg_)
-        
-            elif isinstance(arg, neo.core.Segment):
-                if analog_index is None:
-                    ret.segments.append(arg)
-                    
-                else:
-                    seg_ = neo.Segment(rec_datetime = arg.rec_datetime)
-                    seg_.annotate(origin=arg.file_origin, original_segment=segment_index)
-                    
-                    if isinstance(analog_index, str):
-                        seg_.analogsignals.append(arg.analogsignals[get_index_of_named_signal(arg, analog_index)].copy())
-                        
-                    elif isinstance(analog_index, int):
-                        seg_.analogsignals.append(arg.analogsignals[analog_index].copy())
-                        
-                    elif isinstance(analog_index, (tuple, list)):
-                        for sigNdx in analog_index:
-                            if isinstance(sigNdx, str):
-                                sigNdx = get_index_of_named_signal(arg, sigNdx)
-                                
-                            elif not isinstance(sigNdx, int):
-                                raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
-                                
-                            seg_.analogsignals.append(arg.analogsignals[sigNdx].copy())
-                            
-                    else:
-                        raise TypeError("analog_index parameter expected to be None, a str, int or a sequence of these types; got %s instead" % type(analog_index).__name__)
-                        
-                    ret.segments.append(seg_)
-        
-                    
     else:
         raise TypeError("Expecting a neo.Block or a sequence of neo.Block objects, got %s instead" % type(args).__name__)
             
     return ret
 
+__average_blocks_kwargs__ = frozenset(("count", "every", "name", "segment_index", 
+                                       "analog_index", "annotation", "rec_datetime", 
+                                       "file_origin", "file_datetime", "block_names",
+                                       "legacy_name_inspect"))
+
 #@safeWrapper
 def average_blocks(*args, **kwargs):
     """Generates a block containing a list of averaged AnalogSignal data from the *args.
@@ -4252,6 +4256,17 @@ def average_blocks(*args, **kwargs):
         
         file_datetime       see neo.Block docstring
         
+        block_names         sequence of str, one for each block in args, used 
+                            to annotate the origin of the averaged data;
+                            
+                            optional, default is None: use the block's name, 
+                            or its file_origin when the name is empty
+        
+        legacy_name_inspect bool, default is False; when True, blocks without
+                            a name or file_origin are named after their symbol
+                            in the caller's namespace (this is slow, as it 
+                            requires stack frame introspection)
+        
     
     Returns:
     --------
@@ -4301,66 +4316,49 @@ def average_blocks(*args, **kwargs):
         
     #print(args)
     
-    n = None
-    m = None
-    segment_index = None
-    analog_index = None
-    
 # we do something like this:
     #BaseDataPath0MinuteAverage = neo.Block()
     #BaseDataPath0MinuteAverage.segments = neoutils.average_segments(BaseDataPath0.segments, n=6, every=6)
     #sgw.plot(BaseDataPath0MinuteAverage, signals=["Im_prim_1", "Vm_sec_1"])
 
+    unexpected = kwargs.keys() - __average_blocks_kwargs__
     
-    ret = neo.core.block.Block()
+    if len(unexpected):
+        raise RuntimeError("Unexpected named parameter %s" % ", ".join(unexpected))
     
-    if len(kwargs) > 0 :
-        for key in kwargs.keys():
-            if key not in ["count", "every", "name", "segment_index", 
-                           "analog_index", "annotation", "rec_datetime", 
-                           "file_origin", "file_datetime"]:
-                raise RuntimeError("Unexpected named parameter %s" % key)
-            
-        if "count" in kwargs.keys():
-            n = kwargs["count"]
-            
-        if "every" in kwargs.keys():
-            m = kwargs["every"]
-            
-        if "name" in kwargs.keys():
-            ret.name = kwargs["name"]
-            
-        if "segment_index" in kwargs.keys():
-            segment_index = kwargs["segment_index"]
-            
-        if "analog_index" in kwargs.keys():
-            analog_index = kwargs["analog_index"]
-            
-        if "annotation" in kwargs.keys():
-            ret.annotation = kwargs["annotation"]
-
-        if "rec_datetime" in kwargs.keys():
-            ret.rec_datetime = kwargs["datetime"]
-            
-        if "file_origin" in kwargs.keys():
-            ret.file_origin = kwargs["file_origin"]
-            
-        if "file_datetime" in kwargs.keys():
-            ret.file_datetime = kwargs["file_datetime"]
-            
-    def __applyRecDateTime(sgm, blk):
-        if sgm.rec_datetime is None:
-            sgm.rec_datetime = blk.rec_datetime
+    n               = kwargs.get("count", None)
+    m               = kwargs.get("every", None)
+    segment_index   = kwargs.get("segment_index", None)
+    analog_index    = kwargs.get("analog_index", None)
+    
+    ret = neo.core.block.Block(name = kwargs.get("name", None),
+                               rec_datetime = kwargs.get("rec_datetime", None),
+                               file_origin = kwargs.get("file_origin", None),
+                               file_datetime = kwargs.get("file_datetime", None))
+    
+    if "annotation" in kwargs:
+        ret.annotation = kwargs["annotation"]
             
-        return sgm
-        
+    # NOTE: segments without rec_datetime inherit it from their block
     if segment_index is None:
-        #segments = [block.segments for block in args]
-        segments = [[__applyRecDateTime(sgm, b) for sgm in b.segments] for b in args]
+        for b in args:
+            for sgm in b.segments:
+                if sgm.rec_datetime is None:
+                    sgm.rec_datetime = b.rec_datetime
+                    
+        segments = [b.segments for b in args]
         
     elif isinstance(segment_index, int):
-        #segments = [block.segments[segment_index] for block in args if segment_index < len(block.segments)]
-        segments = [__applyRecDateTime(b.segments[segment_index], b) for b in args if segment_index < len(b.segments)]
+        segments = list()
+        
+        for b in args:
+            if segment_index < len(b.segments):
+                sgm = b.segments[segment_index]
+                
+                if sgm.rec_datetime is None:
+                    sgm.rec_datetime = b.rec_datetime
+                    
+                segments.append(sgm)
         
     else:
         raise TypeError("Unexpected segment index type (%s) -- expected an int" % segment_index)
@@ -4378,29 +4376,37 @@ def average_blocks(*args, **kwargs):
     else:
         signal_str = "all"
         
-    block_names= list()
-    
-    #print(args)
+    block_names = kwargs.get("block_names", None)
     
-    try:
-        cframe = inspect.getouterframes(inspect.currentframe())[1][0]
-        bname = ""
+    if block_names is None:
+        block_names = list()
+        
+        block_symbols = dict()
+        
+        if kwargs.get("legacy_name_inspect", False):
+            cframe = inspect.getouterframes(inspect.currentframe())[1][0]
+            
+            try:
+                # NOTE: map the identity of the Block objects in the caller's 
+                # namespace to their symbol, once
+                block_symbols = dict((id(v), k) for (k,v) in cframe.f_globals.items() if isinstance(v, neo.Block))
+                
+            finally:
+                del(cframe)
+                
         for b in args:
             if b.name is None or len(b.name) == 0:
                 if b.file_origin is None or len(b.file_origin) == 0:
-                    for (k,v) in cframe.f_globals.items():
-                        if isinstance(v, neo.Block) and v == b:
-                            bname = k
+                    bname = block_symbols.get(id(b), "")
                 else:
                     bname = b.file_origin
             else:
                 bname = b.name
                 
             block_names.append(bname)
-                    
-        
-    finally:
-        del(cframe)
+            
+    elif len(block_names) != len(args):
+        raise ValueError("Expecting %d block names; got %d instead" % (len(args), len(block_names)))
         
     ret.segments = average_segments(segments, count=n, every=m, analog_index=analog_index)
     
@@ -4467,25 +4473,47 @@ def average_blocks_by_segments(*args, **kwargs):
             
     # first check all blocks in the list have the same number of segments
     
-    nSegs = [len(block.segments) for block in args]
+    nSegs = np.fromiter((len(block.segments) for block in args), dtype=np.intp)
     
-    if min(nSegs) != max(nSegs):
+    if nSegs.min() != nSegs.max():
         raise ValueError("The blocks must contain equal number of segments")
     
-    nSegs = nSegs[0]
+    nSegs = int(nSegs[0])
     
     # the check all segments have the same number of signals
-    #nSigs = [[len(segment.analogsignals) for segment in block.segments] for block in args]
+    # NOTE: (blocks, segments) array of signal counts
+    nSigs = np.array([[len(segment.analogsignals) for segment in block.segments] for block in args], 
+                     dtype=np.intp).reshape((len(args), nSegs))
+    
+    if np.any(nSigs != nSigs[0]):
+        raise ValueError("Corresponding segments must have the same number of signals")
     
     ret = neo.Block()
     
-    for k in range(nSegs):
-        nSigs = [len(block.segments[k].analogsignals) for block in args]
-        if min(nSigs) != max(nSigs):
-            raise ValueError("Corresponding segments must have the same number of signals")
+    # NOTE: when the selected signals are aligned across all blocks and 
+    # segments, average all segments at once
+    if analog_index is None:
+        grid = [[seg.analogsignals for seg in block.segments] for block in args]
+        
+    else:
+        grid = [[[seg.analogsignals[i] for i in __resolve_signal_indices__(seg.analogsignals, analog_index)] for seg in block.segments] for block in args]
         
-        segment = average_segments([block.segments[k] for block in args], analog_index = analog_index)
-        ret.segments.append(segment[0])
+    averages = __average_signal_grid__(grid) if nSegs > 0 else None
+    
+    if averages is not None:
+        for k, signals in enumerate(averages):
+            segment = neo.Segment()
+            
+            if args[0].segments[k].rec_datetime is not None:
+                segment.rec_datetime = args[0].segments[k].rec_datetime
+                
+            segment.analogsignals.extend(signals)
+            ret.segments.append(segment)
+            
+    else:
+        for k in range(nSegs):
+            segment = average_segments([block.segments[k] for block in args], analog_index = analog_index)
+            ret.segments.append(segment[0])
     
     ret.name="Segment by segment average %s" % name
     
@@ -4496,23 +4524,44 @@ def remove_signal_offset(sig):
     if not isinstance(sig, neo.AnalogSignal):
         raise TypeError("Expecting an AnalogSignal; got %s instead" % type(sig).__name__)
     
-    return sig - sig.min()
+    # NOTE: operate on the magnitude; the signal is created only once
+    data = sig.magnitude
+    
+    return __signal_like__(sig, data - data.min())
+
+# NOTE: thread pool shared by the functions in this module that process 
+# independent signals concurrently; its threads are only started when first 
+# needed. Functions run in this pool must not submit to it themselves.
+__thread_pool__ = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count())
+
+def __batch_map__(func:typing.Callable, signals:typing.Sequence) -> list:
+    """Applies func to each signal in signals; returns a list.
+    Helper for batch_normalise_signals, batch_remove_offset and 
+    auto_define_trigger_events
+    
+    The signals are processed independently, in the module's thread pool, 
+    unless there are too few signals to make it worthwhile. The results are in
+    the order of signals.
+    
+    Threads only run concurrently while func is outside the interpreter, 
+    i.e. in numpy calls that release the GIL or in numba kernels compiled with
+    nogil=True (e.g. the trigger edge detection); func should spend most of 
+    its time there.
+    """
+    if len(signals) < 4:
+        return [func(sig) for sig in signals]
+    
+    return list(__thread_pool__.map(func, signals))
 
+# NOTE: the batch functions map the decorated functions, so that an error in
+# one signal only yields None at that signal's position in the result
 @safeWrapper
 def batch_normalise_signals(*arg):
-    ret = list()
-    for sig in arg:
-        ret.append(peak_normalise_signal(sig))
-        
-    return ret
+    return __batch_map__(peak_normalise_signal, arg)
 
 @safeWrapper
 def batch_remove_offset(*arg):
-    ret = list()
-    for sig in arg:
-        ret.append(remove_signal_offset(sig))
-
-    return ret
+    return __batch_map__(remove_signal_offset, arg)
     
 @safeWrapper
 def peak_normalise_signal(sig, minVal=None, maxVal=None):
@@ -4547,6 +4596,15 @@ def peak_normalise_signal(sig, minVal=None, maxVal=None):
             
         else:
             raise TypeError("When signal is not an analog signal both minVal and maxVal must be specified")
+        
+    if isinstance(sig, (neo.AnalogSignal, DataSignal)):
+        # NOTE: operate on the magnitude; the (dimensionless) signal is 
+        # created only once
+        data = sig.magnitude
+        minVal, maxVal = [v.rescale(sig.units).magnitude if isinstance(v, pq.Quantity) else v for v in (minVal, maxVal)]
+        
+        return __signal_like__(sig, (data - minVal)/(maxVal - minVal), 
+                               units = pq.dimensionless)
 
     return (sig - minVal)/(maxVal - minVal)
 
@@ -4577,6 +4635,12 @@ def average_segments_in_block(data, **kwargs):
         NOTE: All segments in "Data" must contain the same number of channels,
         and these channels must have the same names.
         
+    "name" = str: the name of the averaged data, used in the name of the 
+        returned block
+        
+        optional: by default, this is the name of "data", or its file_origin
+        when the name is empty, or "Block"
+        
     
     
     This will average individual signals in all the segments in data.
@@ -4613,7 +4677,7 @@ def average_segments_in_block(data, **kwargs):
         for key in kwargs.keys():
             if key not in ["segment_index", "analog_index", 
                            "annotation", "rec_datetime", 
-                           "file_origin", "file_datetime"]:
+                           "file_origin", "file_datetime", "name"]:
                 raise RuntimeError("Unexpected named parameter %s" % key)
             
         if "segment_index" in kwargs.keys():
@@ -4624,14 +4688,22 @@ def average_segments_in_block(data, **kwargs):
             
     
     if segment_index is not None:
-        if isinstance(segment_index, (tuple, list)) and all(isinstance(k, numbers.Integral) and k >=0 and k <len(data.segments) for k in segment_index):
-            sgm = [data.segments[k] for k in segment_index]
-            
-        elif isinstance(segment_index, (slice, numbers.Integral)):
+        if isinstance(segment_index, (slice, numbers.Integral)):
             sgm = data.segments[segment_index]
             
-        elif isinstance(segment_index, range):
-            sgm = [data.segments[k] for k in segment_index]
+        elif isinstance(segment_index, (tuple, list, range, np.ndarray)):
+            # NOTE: check the indices at once, as a numpy array
+            idx = np.asarray(segment_index)
+            
+            if idx.ndim != 1 or (idx.size > 0 and idx.dtype.kind not in "iu"):
+                raise ValueError("Invalid segment index; got: %s" % (str(segment_index)))
+            
+            idx = idx.astype(np.intp, copy=False)
+            
+            if np.any(idx < 0) or np.any(idx >= len(data.segments)):
+                raise ValueError("Invalid segment index; got: %s" % (str(segment_index)))
+            
+            sgm = [data.segments[k] for k in idx.tolist()]
             
         else:
             raise ValueError("Invalid segment index; got: %s" % (str(segment_index)))
@@ -4646,24 +4718,18 @@ def average_segments_in_block(data, **kwargs):
     ret.file_origin = data.file_origin
     ret.rec_datetime = data.rec_datetime
     
-    if data.name is None or (isinstance(data.name, str) and len(data.name) == 0):
-        #data_name = kwargs["data"]
-        if data.file_origin is not None and isinstance(data.file_origin, str) and len(data.file_origin) > 0:
-            data_name = data.file_origin
-            
-        else:
-            # find the variable name of data in the caller stack frame
-            cframe = inspect.getouterframes(inspect.currentframe())[1][0]
-            try:
-                for (k,v) in cframe.f_globals.items():
-                    if isinstance(v, neo.Block) and v == data:
-                        data_name = k
-            finally:
-                del(cframe)
+    data_name = kwargs.get("name", None)
+    
+    if data_name is None:
+        if data.name is None or (isinstance(data.name, str) and len(data.name) == 0):
+            if data.file_origin is not None and isinstance(data.file_origin, str) and len(data.file_origin) > 0:
+                data_name = data.file_origin
+                
+            else:
                 data_name = "Block"
-            
-    else:
-        data_name = data.name
+                
+        else:
+            data_name = data.name
         
     ret.name = "Average of %s" % (data_name)
         
@@ -4716,6 +4782,12 @@ def neo_copy(src: typing.Union[neo.Block, neo.Segment, neo.ChannelIndex, neo.Uni
         # original channel: {"copy": copied channel, "units": {original unit: copied unit}}
         channels = dict() 
         
+        # NOTE: id of the original signal or unit: the copied channel or unit
+        # (the source channel indexes hold references to the data objects in
+        # the source segments)
+        signal_channels = dict()
+        unit_copies = dict()
+        
         for c in src.channel_indexes:
             c_ = neo.ChannelIndex(index=c.index, name=c.name, 
                                   channel_ids=c.channel_ids,
@@ -4726,17 +4798,22 @@ def neo_copy(src: typing.Union[neo.Block, neo.Segment, neo.ChannelIndex, neo.Uni
                                   **c.annotations)
             
             c_.block = ret
+            ret.channel_indexes.append(c_)
             
             channels[c] = {"copy": c_, "units": dict()}
             
-            for u_ in c.units:
+            for sig in c.analogsignals:
+                signal_channels[id(sig)] = c_
+            
+            for u in c.units:
                 u_ = neo.Unit(name=u.name, description=u.description,
-                              fle_origin=u.file_origin,
+                              file_origin=u.file_origin,
                               **u.annotations)
-                u_.channel_index = u.c_
+                u_.channel_index = c_
                 c_.units.append(u_)
                 
                 channels[c]["units"][u] = u_
+                unit_copies[id(u)] = u_
                 
         for s in src.segments:
             s_ = neo.Segment(name=s.name, description=s.description,
@@ -4749,21 +4826,22 @@ def neo_copy(src: typing.Union[neo.Block, neo.Segment, neo.ChannelIndex, neo.Uni
             for asig in s.analogsignals:
                 asig_ = asig.copy()
                 
-                for c in channels:
-                    #if asig in c.analogsignals:
-                    if any([np.all(asig==sig) for sig in c.analogsignals]):
-                        asig_.channel_index = channels[c]
-                        channels[c]["copy"].analogsignals.append(asig_)
+                c_ = signal_channels.get(id(asig), None)
+                
+                if c_ is not None:
+                    asig_.channel_index = c_
+                    c_.analogsignals.append(asig_)
                 
                 s_.analogsignals.append(asig_)
                 
             for st in s.spiketrains:
                 st_ = st.copy()
                 
-                for c in channels:
-                    if len(c["units"]):
-                        if st.unit in c["units"]:
-                            st_.unit = c["units"][u]
+                u_ = unit_copies.get(id(st.unit), None)
+                
+                if u_ is not None:
+                    st_.unit = u_
+                    u_.spiketrains.append(st_)
                 
                 s_.spiketrains.append(st_)
                     
@@ -4795,35 +4873,330 @@ def neo_copy(src: typing.Union[neo.Block, neo.Segment, neo.ChannelIndex, neo.Uni
         
         ret.analogsignals += [s.copy() for s in src.analogsignals]
         
-        ret.irregularlysampledsignals += [s.copy() for s in src.irregularlysampledsignals]
+        ret.irregularlysampledsignals += [s.copy() for s in src.irregularlysampledsignals]
+
+        ret.spiketrains += [s.copy() for s in src.spiketrains]
+        
+        ret.create_many_to_one_relationship()
+        
+    elif isinstance(src, neo.ChannelIndex):
+        # NOTE: 2020-03-14 00:42:29
+        # bare-bones copy; the analogsignals and units are NOT copied
+        # the respective links must be restored manually
+        ret = neo.ChannelIndex(index=src.index, name=src.name, 
+                               channel_ids=src.channel_ids,
+                               channel_names=src.channel_names,
+                               description=src.description,
+                               file_origin=src.file_origin,
+                               coordinates=src.coordinates,
+                               **src.annotations)
+        
+    elif isinstance(src, neo.Unit):
+        # NOTE: 2020-03-14 00:55:16
+        # bare-bones copy; the spiketrains and channel_index are NOT copied
+        # the respective links must be restored manually
+        ret = neo.Unit(name=src.name, description=src.description,
+                       file_origin=src.file_origin,
+                       **src.annotations)
+        
+    else:
+        raise TypeError("Expecting a neo.Block or a neo.Segment; got %s instead" % type(src).__name__)
+
+    return ret
+
+def __signal_like__(sig, data, units=None):
+    """Returns a new signal of the same type, units and domain as 'sig', with 'data'.
+    
+    The new signal has the name, description and a copy of the annotations 
+    and array annotations of 'sig'. 'data' (a numpy array with the same shape
+    as 'sig') is not copied.
+    
+    units: None (default) or a python Quantity; when given, it replaces the
+        units of 'sig' in the new signal
+    """
+    if units is None:
+        units = sig.units
+        
+    if isinstance(sig, DataSignal):
+        ret = DataSignal(data, units = units, copy = False,
+                         origin = sig.origin, 
+                         sampling_period = sig.sampling_period,
+                         name = sig.name, 
+                         file_origin = sig.file_origin,
+                         description = sig.description,
+                         **sig.annotations)
+        
+    else:
+        ret = neo.AnalogSignal(data, units = units, copy = False,
+                               t_start = sig.t_start, 
+                               sampling_period = sig.sampling_period,
+                               name = sig.name, 
+                               file_origin = sig.file_origin,
+                               description = sig.description,
+                               **sig.annotations)
+        
+    # NOTE: the number of channels is unchanged, so the per-channel array 
+    # annotations (e.g. channel names) still apply
+    if getattr(sig, "array_annotations", None):
+        ret.array_annotations = copy.deepcopy(sig.array_annotations)
+        
+    return ret
+
+if __has_numba__:
+    @numba.njit(parallel=True, cache=True)
+    def __stack_mean_kernel__(stack):
+        """Column means of a 2D array (samples stacked along the first axis).
+        """
+        n, m = stack.shape
+        ret = np.empty(m, dtype=np.float64)
+        
+        for j in numba.prange(m):
+            acc = 0.
+            
+            for i in range(n):
+                acc += stack[i, j]
+                
+            ret[j] = acc / n
+            
+        return ret
+    
+def __stack_mean__(stack:np.ndarray) -> np.ndarray:
+    """Mean along the first axis of stacked signal magnitudes.
+    
+    Uses a compiled, multi-threaded kernel when numba is available, and
+    numpy.mean otherwise; the result has the dtype of stack either way.
+    """
+    if __has_numba__ and stack.dtype in __numba_float_dtypes__:
+        flat = np.ascontiguousarray(stack).reshape((stack.shape[0], -1))
+        return __stack_mean_kernel__(flat).reshape(stack.shape[1:]).astype(stack.dtype, copy=False)
+    
+    return stack.mean(axis=0)
+
+if __has_numba__:
+    @numba.njit(cache=True)
+    def __pad_copy_kernel__(src, rows, cols):
+        """Copies a 2D array into a NaN-filled 2D array of shape (rows, cols).
+        """
+        ret = np.empty((rows, cols), dtype=np.float64)
+        
+        r = min(rows, src.shape[0])
+        c = min(cols, src.shape[1])
+        
+        for i in range(rows):
+            for j in range(cols):
+                if i < r and j < c:
+                    ret[i, j] = src[i, j]
+                    
+                else:
+                    ret[i, j] = np.nan
+                    
+        return ret
+    
+def __pad_copy__(src:np.ndarray, shape:tuple) -> np.ndarray:
+    """Copies a 2D array into a new 2D array with the given shape.
+    
+    'src' is truncated along the axes where it is larger than 'shape', and 
+    padded with NaN along the axes where it is smaller.
+    
+    Uses a compiled kernel when numba is available.
+    """
+    if __has_numba__ and src.dtype in __numba_float_dtypes__:
+        return __pad_copy_kernel__(src, shape[0], shape[1])
+    
+    ret = np.full(shape, np.nan)
+    
+    r = min(shape[0], src.shape[0])
+    c = min(shape[1], src.shape[1])
+    
+    ret[:r, :c] = src[:r, :c]
+    
+    return ret
+
+def __average_aligned_signals__(signals:typing.Sequence):
+    """Element-by-element average of signals with identical shapes and sampling rates.
+    Helper for average_segments
+    
+    The signals are stacked in one array and averaged in a single pass
+    (see __stack_mean__).
+    
+    Returns a new signal with the domain, units, name and annotations of 
+    the first signal, or None when the signals differ in their shape or 
+    sampling rate (and therefore need to be resampled and/or padded before 
+    averaging).
+    """
+    sig0 = signals[0]
+    
+    if any(s.shape != sig0.shape or s.sampling_rate != sig0.sampling_rate for s in signals[1:]):
+        return
+    
+    units = sig0.units
+    
+    stack = np.stack([s.magnitude if s.units == units else s.rescale(units).magnitude for s in signals], axis=0)
+    
+    return __signal_like__(sig0, __stack_mean__(stack))
+
+def __segment_matrix__(signals:typing.Sequence, units:typing.Optional[typing.Sequence]=None, 
+                       out:typing.Optional[np.ndarray]=None) -> np.ndarray:
+    """Stacks the channels of signals with the same number of samples, horizontally.
+    Helper for __average_signal_matrix__
+    
+    Returns a 2D array (samples, channels) with the channels of all signals,
+    in the order of the signals.
+    
+    units: None (default) or a sequence of python Quantity objects, one per 
+        signal: the units in which the samples of each signal are expressed
+        
+    out: None (default) or a 2D numpy array with the appropriate shape, 
+        which is filled and returned, instead of allocating a new array
+    """
+    if out is None:
+        out = np.empty((signals[0].shape[0], sum(s.shape[1] for s in signals)), 
+                       dtype = signals[0].dtype)
+        
+    col = 0
+    
+    for l, s in enumerate(signals):
+        k = s.shape[1]
+        
+        if units is None or s.units == units[l]:
+            out[:, col:col+k] = s.magnitude
+            
+        else:
+            out[:, col:col+k] = s.rescale(units[l]).magnitude
+            
+        col += k
+        
+    return out
+
+def __average_signal_matrix__(rows:typing.Sequence, starts:typing.Optional[typing.Sequence]=None):
+    """Element-by-element average of corresponding signals across segments.
+    Helper for average_segments
+    
+    rows: nested sequence of signals: segments -> signals
+    
+    starts: None (default) or a sequence of int: the indices in rows where 
+        contiguous ranges of segments start; each range ends where the next 
+        one starts (the last one ends with rows)
+        
+        When given, the signals are averaged separately in each range, and 
+        the function returns a list of lists of averaged signals (one list 
+        per range); the averaged signals have the domain, name and 
+        annotations of the signals in the first segment of each range.
+    
+    When all signals have the same number of samples, and corresponding 
+    signals have the same shape and sampling rate in all segments, the 
+    signals in each segment are stacked in a (samples, channels) matrix (see 
+    __segment_matrix__) and all signals are averaged across segments in a 
+    single pass (see __stack_mean__).
+    
+    Returns a list with the averaged signals, with the domain, units, name 
+    and annotations of the signals in the first segment, or None when the 
+    signals are not aligned.
+    """
+    ref = rows[0]
+    
+    if len(ref) == 0 or any(len(signals) != len(ref) for signals in rows[1:]):
+        return
+    
+    nSamples = ref[0].shape[0]
+    
+    for l, sig0 in enumerate(ref):
+        if sig0.shape[0] != nSamples:
+            return
+        
+        if any(signals[l].shape != sig0.shape or signals[l].sampling_rate != sig0.sampling_rate for signals in rows[1:]):
+            return
+        
+    units = [s.units for s in ref]
+    
+    stack = np.empty((len(rows), nSamples, sum(s.shape[1] for s in ref)), 
+                     dtype = ref[0].dtype)
+    
+    for k, signals in enumerate(rows):
+        __segment_matrix__(signals, units, out = stack[k])
+        
+    if starts is not None:
+        stops = list(starts[1:]) + [len(rows)]
+        
+        # NOTE: a sum along the first axis adds the segments one by one, 
+        # giving the same numbers as accumulating the signals one by one; 
+        # numpy.add.reduceat does not (it differs in the last bit)
+        avg = [stack[start:stop].sum(axis=0) / (stop - start) for start, stop in zip(starts, stops)]
+        
+        ret = list()
+        
+        for start, tile in zip(starts, avg):
+            col = 0
+            signals = list()
+            
+            for sig0, u in zip(rows[start], units):
+                k = sig0.shape[1]
+                signals.append(__signal_like__(sig0, tile[:, col:col+k], units = u))
+                col += k
+                
+            ret.append(signals)
+            
+        return ret
+    
+    avg = __stack_mean__(stack)
+    
+    ret = list()
+    
+    col = 0
+    
+    for sig0 in ref:
+        k = sig0.shape[1]
+        ret.append(__signal_like__(sig0, avg[:, col:col+k]))
+        col += k
+        
+    return ret
 
-        ret.spiketrains += [s.copy() for s in src.spiketrains]
+def __average_signal_grid__(grid:typing.Sequence):
+    """Averages signals across blocks, for each segment index.
+    Helper for average_blocks_by_segments
+    
+    grid: nested sequence of signals: blocks -> segments -> signals
+    
+    When each signal has the same shape and sampling rate in all segments of
+    all blocks, the signals are stacked in a 4D array 
+    (blocks, segments, samples, channels) and averaged across blocks in a 
+    single pass (see __stack_mean__).
+    
+    Returns a list (one element per segment) of lists of averaged signals, 
+    with the domain, units, name and annotations of the signals in the first
+    block, or None when the signals are not aligned.
+    """
+    ref = grid[0]
+    
+    nSigs = len(ref[0])
+    
+    if any(len(signals) != nSigs for block in grid for signals in block):
+        return
+    
+    for l in range(nSigs):
+        sig0 = ref[0][l]
         
-        ret.create_many_to_one_relationship()
+        if any(signals[l].shape != sig0.shape or signals[l].sampling_rate != sig0.sampling_rate for block in grid for signals in block):
+            return
         
-    elif isinstance(src, neo.ChannelIndex):
-        # NOTE: 2020-03-14 00:42:29
-        # bare-bones copy; the analogsignals and units are NOT copied
-        # the respective links must be restored manually
-        ret = neo.ChannelIndex(index=src.index, name=src.name, 
-                               channel_ids=src.channel_ids,
-                               channel_names=src.channel_names,
-                               description=src.description,
-                               file_origin=src.file_origin,
-                               coordinates=src.coordinates,
-                               **src.annotations)
+    ret = [list() for signals in ref]
+    
+    for l in range(nSigs):
+        sig0 = ref[0][l]
         
-    elif isinstance(src, neo.Unit):
-        # NOTE: 2020-03-14 00:55:16
-        # bare-bones copy; the spiketrains and channel_index are NOT copied
-        # the respective links must be restored manually
-        ret = neo.Unit(name=src.name, description=src.description,
-                       file_origin=src.file_origin,
-                       **src.annotations)
+        stack = np.empty((len(grid), len(ref)) + sig0.shape, dtype = sig0.dtype)
         
-    else:
-        raise TypeError("Expecting a neo.Block or a neo.Segment; got %s instead" % type(src).__name__)
-
+        for bi, block in enumerate(grid):
+            for si, signals in enumerate(block):
+                s = signals[l]
+                units = ref[si][l].units
+                stack[bi, si] = s.magnitude if s.units == units else s.rescale(units).magnitude
+                
+        avg = __stack_mean__(stack)
+        
+        for si, signals in enumerate(ref):
+            ret[si].append(__signal_like__(signals[l], avg[si]))
+            
     return ret
 
 #@safeWrapper
@@ -4838,10 +5211,10 @@ def average_segments(*args, **kwargs):
         
     
     """
-    from . import datatypes as dt
     
     def __resample_add__(signal, new_signal):
-        from . import datatypes as dt
+        # NOTE: new_signal is only read here; it is NOT copied unless it 
+        # needs to be resampled or padded
         if new_signal.sampling_rate != signal.sampling_rate:
             ss = resample_poly(new_signal, signal.sampling_rate)
             
@@ -4851,32 +5224,17 @@ def average_segments(*args, **kwargs):
         # neo.AnalogSignal and DataSignal always have ndim == 2
         
         if ss.shape != signal.shape:
-            ss_ = neo.AnalogSignal(np.full_like(signal, np.nan),
-                                                units = signal.units,
-                                                t_start = signal.t_start,
-                                                sampling_rate = signal.sampling_rate,
-                                                name = ss.name,
-                                                **signal.annotations)
-            
-            src_slicing = [slice(k) for k in ss.shape]
-            
-            dest_slicing = [slice(k) for k in ss_.shape]
-            
-            if ss.shape[0] < ss_.shape[0]:
-                dest_slicing[0] = src_slicing[0]
-                
-            else:
-                src_slicing[0]  = dest_slicing[0]
-                
-            if ss.shape[1] < ss_.shape[1]:
-                dest_slicing[1] = src_slicing[1]
-                
-            else:
-                src_slicing[1] = dest_slicing[1]
-                
-            ss_[tuple(dest_slicing)] = ss[tuple(src_slicing)]
-            
-            ss = ss_
+            # NOTE: truncate or pad with NaN the samples of ss, in the units 
+            # of signal
+            data = ss.magnitude if ss.units == signal.units else ss.rescale(signal.units).magnitude
+            
+            ss = neo.AnalogSignal(__pad_copy__(data, signal.shape),
+                                  units = signal.units,
+                                  t_start = signal.t_start,
+                                  sampling_rate = signal.sampling_rate,
+                                  name = ss.name,
+                                  copy = False,
+                                  **signal.annotations)
                 
         return ss
     
@@ -4888,7 +5246,7 @@ def average_segments(*args, **kwargs):
     if len(args) == 1:
         args = args[0]
     
-    if all([isinstance(s, (tuple, list)) for s in args]):
+    if all(isinstance(s, (tuple, list)) for s in args):
         slist = list()
         
         for it in args:
@@ -4897,7 +5255,7 @@ def average_segments(*args, **kwargs):
                 
         args = slist
         
-    if not all([isinstance(a, neo.Segment) for a in args]):
+    if not all(isinstance(a, neo.Segment) for a in args):
         raise TypeError("This function only works with neo.Segment objects")
         
     n = None
@@ -4923,183 +5281,264 @@ def average_segments(*args, **kwargs):
         ranges_avg = [range(0, len(args))] # take the average of the whole segments list
         
     else:
-        ranges_avg = [range(k, k + n) for k in range(0,len(args),m)] # this will result in as many segments in the data block
-        
+        # NOTE: when every < count several ranges may overrun the segments list
+        ranges_avg = [range(k, min(k + n, len(args))) for k in range(0,len(args),m)] # this will result in as many segments in the data block
         
     #print("ranges_avg ", ranges_avg)
     
-    if ranges_avg[-1].stop > len(args):
-        ranges_avg[-1] = range(ranges_avg[-1].start, len(args))
+    def __average__(signals):
+        # NOTE: a single vectorized reduction when the signals are aligned;
+        # otherwise, resample and/or pad then accumulate
+        ret = __average_aligned_signals__(signals)
         
-    #print("ranges_avg ", ranges_avg)
+        if ret is None:
+            # NOTE: accumulate the magnitudes in one preallocated buffer, in 
+            # the units of the first signal
+            sig0 = signals[0]
+            units = sig0.units
+            shape = sig0.shape
+            rate = sig0.sampling_rate
+            
+            acc = np.array(sig0.magnitude, dtype=np.float64)
+            
+            for s in signals[1:]:
+                # NOTE: resample and/or pad only the signals that need it
+                ss = s if s.shape == shape and s.sampling_rate == rate else __resample_add__(sig0, s)
+                acc += ss.magnitude if ss.units == units else ss.rescale(units).magnitude
+                
+            acc /= len(signals)
+            
+            ret = __signal_like__(sig0, acc)
+            
+        return ret
+    
+    # NOTE: signal name -> index of the signal found by the last lookup; the
+    # cached index is checked against the signal name in each segment, and
+    # the signals are searched again only when the layout differs
+    name_cache = dict()
+    
+    def __named_signal_index__(seg, name):
+        signals = seg.analogsignals
+        ndx = name_cache.get(name, None)
+        
+        if ndx is None or ndx >= len(signals) or signals[ndx].name != name:
+            ndx = __name_index__(signals, name, False)
+            name_cache[name] = ndx
+            
+        return ndx
+    
+    # NOTE: contiguous, non-overlapping ranges of segments (tiles) are 
+    # averaged all at once, when possible
+    tiled = m is None or m == n
+    starts = [range_avg.start for range_avg in ranges_avg]
+    
+    def __average_ranges__(select):
+        # select: function that returns the list of signals to average, 
+        # in a segment
+        # returns a list (one per range) of lists of averaged signals
+        if tiled:
+            ret = __average_signal_matrix__([select(arg) for arg in args], starts)
+            
+            if ret is not None:
+                return ret
+            
+        ret = list()
+        
+        for range_avg in ranges_avg:
+            rows = [select(args[k]) for k in range_avg]
+            
+            # NOTE: try to average all signals at once
+            avg = __average_signal_matrix__(rows)
+            
+            if avg is None:
+                avg = [__average__([signals[l] for signals in rows]) for l in range(len(rows[0]))]
+                
+            ret.append(avg)
+            
+        return ret
     
     ret_seg = list() #  a LIST of segments, each containing averaged analogsignals!
     
     if analog_index is None: #we want an average across the Block list for all signals in the segments
-        if not all([len(arg.analogsignals) == len(args[0].analogsignals) for arg in args[1:]]):
+        nSigs = len(args[0].analogsignals)
+        
+        if any(len(arg.analogsignals) != nSigs for arg in args[1:]):
             raise ValueError("All segments must have the same number of analogsignals")
         
-        for range_avg in ranges_avg:
-            #print("range_avg: ", range_avg.start, range_avg.stop)
-            #continue
+        averages = __average_ranges__(lambda seg: seg.analogsignals)
         
-            seg = neo.core.segment.Segment()
-            
-            for k in range_avg:
-                if k == range_avg.start:
-                    if args[k].rec_datetime is not None:
-                        seg.rec_datetime = args[k].rec_datetime
-
-                    for sig in args[k].analogsignals:
-                        seg.analogsignals.append(sig.copy())
-
-                elif k < len(args):
-                    for (l,s) in enumerate(args[k].analogsignals):
-                        seg.analogsignals[l] += __resample_add__(seg.analogsignals[l], s)
-
-            for sig in seg.analogsignals:
-                sig /= len(range_avg)
-
-            ret_seg.append(seg)
-            
     elif isinstance(analog_index, str): # only one signal indexed by name
-        for range_avg in ranges_avg:
-            seg = neo.core.segment.Segment()
-            for k in range_avg:
-                if k == range_avg.start:
-                    if args[k].rec_datetime is not None:
-                        seg.rec_datetime = args[k].rec_datetime
-                        
-                    seg.analogsignals.append(args[k].analogsignals[get_index_of_named_signal(args[k], analog_index)].copy())
-                    
-                else:
-                    s = args[k].analogsignals[get_index_of_named_signal(args[k], analog_index)].copy()
-
-                    seg.analogsignals[0] += __resample_add__(seg.analogsignals[0], s)
-                    
-            seg.analogsignals[0] /= len(range_avg) # there is only ONE signal in this segment!
+        # there is only ONE signal in each segment!
+        averages = __average_ranges__(lambda seg: [seg.analogsignals[__named_signal_index__(seg, analog_index)]])
+        
+    elif isinstance(analog_index, int):
+        # there is only ONE signal in each segment!
+        averages = __average_ranges__(lambda seg: [seg.analogsignals[analog_index]])
+        
+    elif isinstance(analog_index, (list, tuple)):
+        for sigNdx in analog_index:
+            if not isinstance(sigNdx, (str, int)):
+                raise TypeError("Signal index expected to be a str or an int; got %s instead" % type(sigNdx).__name__)
             
-            ret_seg.append(seg)
+        # NOTE: signal names are resolved in each segment; then the 
+        # signals are averaged across segments, for each element of 
+        # analog_index
+        averages = __average_ranges__(lambda seg: [seg.analogsignals[__named_signal_index__(seg, sigNdx) if isinstance(sigNdx, str) else sigNdx] for sigNdx in analog_index])
             
-    elif isinstance(analog_index, int):
-        #print("analog_index ", analog_index)
-        for range_avg in ranges_avg:
-            seg = neo.core.segment.Segment()
+    else:
+        raise TypeError("Unexpected type for signal index")
+    
+    for range_avg, signals in zip(ranges_avg, averages):
+        seg = neo.core.segment.Segment()
+        
+        if isinstance(analog_index, int):
             for k in range_avg:
                 if args[k].rec_datetime is not None:
                     seg.rec_datetime = args[k].rec_datetime
                     
-                if k == range_avg.start:
-                    seg.analogsignals.append(args[k].analogsignals[analog_index].copy())
-                    
-                else:
-                    s = args[k].analogsignals[analog_index].copy()
-                    
-                    seg.analogsignals[0] += __resample_add__(seg.analogsignals[0], s)
-                    
-            seg.analogsignals[0] /= len(range_avg)# there is only ONE signal in this segment!
-            
-            ret_seg.append(seg)
+        elif args[range_avg.start].rec_datetime is not None:
+            seg.rec_datetime = args[range_avg.start].rec_datetime
             
-    elif isinstance(analog_index, (list, tuple)):
-        for range_avg in ranges_avg:
-            seg = neo.core.segment.Segment()
-            for k in range_avg:
-                if k == range_avg.start:
-                    if args[k].rec_datetime is not None:
-                        seg.rec_datetime = args[k].rec_datetime
+        seg.analogsignals.extend(signals)
+        
+        ret_seg.append(seg)
+    
+    return ret_seg
+    
+def __stack_signal_columns__(signals:typing.Sequence, out:typing.Optional[np.ndarray]=None) -> np.ndarray:
+    """Copies the samples of single-channel signals into the columns of a 2D array.
+    Helper for average_signals and aggregate_signals
+    
+    The samples are expressed in the units of the first signal.
+    
+    out: None, or a 2D numpy array with shape (number of samples, number of
+        signals) which is then filled and returned, instead of allocating a
+        new array.
+    """
+    sig0 = signals[0]
+    units = sig0.units
+    shape = (sig0.shape[0], len(signals))
+    
+    if out is None:
+        out = np.empty(shape, dtype=sig0.dtype)
+        
+    elif out.shape != shape:
+        raise ValueError("Expecting an output array with shape %s; got %s instead" % (shape, out.shape))
+    
+    for k, s in enumerate(signals):
+        out[:, k] = s.magnitude[:, 0] if s.units == units else s.rescale(units).magnitude[:, 0]
+        
+    return out
 
-                    for sigNdx in analog_index:
-                        if isinstance(sigNdx, str):
-                            sigNdx = get_index_of_named_signal(args[k], sigNdx)
-                            
-                        seg.analogsignals.append(args[k].analogsignals[sigNdx].copy()) # will raise an error if sigNdx is of unexpected type
-                        
-                else:
-                    for ds in range(len(analog_index)):
-                        sigNdx = analog_index[ds]
-                        
-                        if isinstance(sigNdx, str):
-                            sigNdx = get_index_of_named_signal(args[k], sigNdx)
-                            
-                        s = args[k].analogsignals[sigNdx].copy()
-                        
-                        seg.analogsignals[ds] += __resample_add__(seg.analogsignals[ds], s)
-                        
-            for sig in seg.analogsignals:
-                sig /= len(range_avg)
+if __has_numba__:
+    @numba.njit(parallel=True, cache=True)
+    def __mean_sd_kernel__(data):
+        """Row-wise mean and sample standard deviation (ddof = 1) of a 2D array.
+        
+        Uses Welford's algorithm: each row is read only once.
+        """
+        n, m = data.shape
+        mean = np.empty(n, dtype=np.float64)
+        sd = np.empty(n, dtype=np.float64)
+        
+        for i in numba.prange(n):
+            mu = 0.
+            m2 = 0.
             
-            ret_seg.append(seg)
+            for j in range(m):
+                delta = data[i, j] - mu
+                mu += delta / (j + 1)
+                m2 += delta * (data[i, j] - mu)
+                
+            mean[i] = mu
+            sd[i] = np.sqrt(m2 / (m - 1)) if m > 1 else np.nan
             
-    else:
-        raise TypeError("Unexpected type for signal index")
+        return mean, sd
     
-    return ret_seg
+def __mean_sd__(data:np.ndarray) -> tuple:
+    """Row-wise mean and sample standard deviation (ddof = 1) of a 2D array.
+    Helper for aggregate_signals
+    
+    Uses a compiled, single-pass kernel when numba is available, and numpy
+    otherwise; the results have the dtype numpy would give either way.
+    """
+    if __has_numba__ and data.dtype in __numba_float_dtypes__:
+        mean, sd = __mean_sd_kernel__(data)
+        return mean.astype(data.dtype, copy=False), sd.astype(data.dtype, copy=False)
     
+    return np.mean(data, axis=1), np.std(data, axis=1, ddof=1)
+
 @safeWrapper
-def average_signals(*args, fun=np.mean):
+def average_signals(*args, fun=np.mean, out=None):
     """ Returns an AnalogSignal containing the element-by-element average of several neo.AnalogSignals.
     All signals must be single-channel and have compatible shapes and sampling rates.
+    
+    Keyword parameters:
+    
+    fun: the numpy reduction function (default is np.mean); it must accept 
+        an 'axis' keyword parameter
+        
+    out: None (default) or a numpy array with shape (number of samples, 
+        number of signals) used as a scratch buffer for the signal samples; 
+        useful to avoid a new memory allocation when the function is called 
+        repeatedly with signals of the same shape
+        
+    Returns a quantities.Quantity array with the units of the first signal.
     """
     
     if len(args) == 0:
         return
     
-    if len(args) == 1 and isinstance(args[0], (list, tuple)) and all([isinstance(a, neo.core.analogsignal.AnalogSignal) for a in args[0]]):
+    if len(args) == 1 and isinstance(args[0], (list, tuple)) and all(isinstance(a, neo.core.analogsignal.AnalogSignal) for a in args[0]):
         args = args[0]
+        
+    ref_shape = args[0].shape
 
-    #ret = args[0].copy() # it will inherit t_start, t_stop, name, annotations, sampling_rate
-    
-    if any([s.shape != args[0].shape for s in args]):
+    if any(s.shape != ref_shape for s in args[1:]):
         raise ValueError("Signals must have identical shape")
     
-    if any([s.shape[1]>1 for s in args]):
+    if ref_shape[1] > 1:
         raise ValueError("Expecting single-channel signals only")
     
-    ret_signal = fun(np.concatenate(args, axis=1), axis=1)
+    # NOTE: one allocation (or none, when 'out' is given) and one pass for 
+    # the samples
+    return pq.Quantity(fun(__stack_signal_columns__(args, out), axis=1), 
+                       units = args[0].units, copy = False)
     
-    return ret_signal
-    #if all([sig.shape == args[0].shape for sig in args[1:]]):
-        #ret_signal = fun(np.concatenate(args, axis=1), axis=1)
-        #return ret_signal
-        
-        ##for sig in args[1:]:
-            ##ret += sig
-            
-        ##ret /= len(args)
-        
-    #else:
-        #raise ValueError("Cannot average AnalogSignal objects of different shapes")
-        
-    
-    return ret
-
 @safeWrapper
 def merge_signal_channels(*args, name=""):
     """Returns an analog signal containing merged channels of the analog signals in args
     """
-    from . import datatypes as dt
     
     def __internal_merge__(*signals):
-        from . import datatypes as dt
-        sigs = [s.magnitude for s in signals]
-        ret_sig = signals[0].__class__(np.concatenate(sigs, axis=1), 
+        # NOTE: copy the channels straight into the merged data array
+        ncols = sum(s.shape[1] for s in signals)
+        data = np.empty((signals[0].shape[0], ncols), dtype = signals[0].dtype)
+        
+        col = 0
+        
+        for s in signals:
+            k = s.shape[1]
+            data[:, col:col+k] = s.magnitude
+            col += k
+            
+        ret_sig = signals[0].__class__(data, 
                                        units = signals[0].units,
                                        sampling_period = signals[0].sampling_period,
                                        t_start = signals[0].t_start,
-                                       name=name)
+                                       name=name, copy=False)
         
         return ret_sig
         
     
-    if not all([isinstance(s, neo.AnalogSignal) for s in args]) and \
-        not all([isinstance(s, DataSignal) for s in args]):
+    if not all(isinstance(s, neo.AnalogSignal) for s in args) and \
+        not all(isinstance(s, DataSignal) for s in args):
         raise TypeError("All data in the parameter sequence must be either AnalogSignal objects or DataSignal objects")
         
-    if not all([s.shape[0] == args[0].shape[0] for s in args]):
+    if any(s.shape[0] != args[0].shape[0] for s in args):
         raise ValueError("Signals must have same axis length")
     
-    if not all([s.sampling_period == args[0].sampling_period for s in args]):
+    if any(s.sampling_period != args[0].sampling_period for s in args):
         raise ValueError("All signals must have the same sampling period")
     
     return __internal_merge__(*args)
@@ -5117,55 +5556,56 @@ def aggregate_signals(*args, name_prefix:str,
     Returns a dict
     
     """
-    from . import datatypes as dt
     
     if len(args) == 0:
         return
     
-    if len(args) == 1 and isinstance(args[0], (list, tuple)) and all([isinstance(a, (neo.AnalogSignal, Datasignal)) for a in args[0]]):
+    if len(args) == 1 and isinstance(args[0], (list, tuple)) and all(isinstance(a, (neo.AnalogSignal, DataSignal)) for a in args[0]):
         args = args[0]
+        
+    ref_shape = args[0].shape
 
-    if any([s.shape != args[0].shape for s in args]):
+    if any(s.shape != ref_shape for s in args[1:]):
         raise ValueError("Signals must have identical shape")
     
-    if any([s.shape[1] > 1 for s in args]):
+    if ref_shape[1] > 1:
         raise ValueError("Expecting single-channel signals only")
     
     count = len(args)
     
-    allsigs = np.concatenate(args, axis=1)
+    allsigs = __stack_signal_columns__(args)
     
-    ret_mean = np.mean(allsigs, axis=1).magnitude
-    
-    ret_SD = np.std(allsigs, axis = 1, ddof=1).magnitude
+    ret_mean, ret_SD = __mean_sd__(allsigs)
     
     ret_SEM = ret_SD/(np.sqrt(count-1))
     
     if collectSD:
-        ret_mean_SD = np.concatenate((ret_mean[:,np.newaxis], 
-                                      (ret_mean-ret_SD)[:,np.newaxis], 
-                                      (ret_mean + ret_SD)[:,np.newaxis]),
-                                     axis=1)
+        ret_mean_SD = np.empty((ret_mean.shape[0], 3), dtype = ret_mean.dtype)
+        ret_mean_SD[:,0] = ret_mean
+        np.subtract(ret_mean, ret_SD, out = ret_mean_SD[:,1])
+        np.add(ret_mean, ret_SD, out = ret_mean_SD[:,2])
         suffix = "mean_SD"
         
         ret_mean_SD = neo.AnalogSignal(ret_mean_SD, units = args[0].units,
                                        sampling_period = args[0].sampling_period,
-                                       name = "%s_%s" % (name_prefix, suffix))
+                                       name = "%s_%s" % (name_prefix, suffix),
+                                       copy = False)
         
     else:
         ret_mean_SD = None
         
     if collectSEM:
-        ret_mean_SEM = np.concatenate((ret_mean[:,np.newaxis], 
-                                       (ret_mean - ret_SEM)[:,np.newaxis],
-                                       (ret_mean + ret_SEM)[:,np.newaxis]), 
-                                     axis=1)
+        ret_mean_SEM = np.empty((ret_mean.shape[0], 3), dtype = ret_mean.dtype)
+        ret_mean_SEM[:,0] = ret_mean
+        np.subtract(ret_mean, ret_SEM, out = ret_mean_SEM[:,1])
+        np.add(ret_mean, ret_SEM, out = ret_mean_SEM[:,2])
         
         suffix = "mean_SEM"
         
         ret_mean_SEM = neo.AnalogSignal(ret_mean_SEM, units = args[0].units,
                                         sampling_period = args[0].sampling_period,
-                                        name = "%s_%s" % (name_prefix, suffix))
+                                        name = "%s_%s" % (name_prefix, suffix),
+                                        copy = False)
     
     else:
         ret_mean_SEM = None
@@ -5206,6 +5646,20 @@ def aggregate_signals(*args, name_prefix:str,
     
     
     
+def __fast_convolve1d__(a:np.ndarray, w:np.ndarray, mode:str="same") -> np.ndarray:
+    """1D convolution dispatched on the kernel size.
+    Helper for convolve
+    
+    Uses numpy.convolve (direct) for kernels shorter than 500 samples, and 
+    scipy.signal.fftconvolve otherwise.
+    """
+    if len(w) < 500:
+        return np.convolve(a, w, mode)
+    
+    from scipy.signal import fftconvolve
+    
+    return fftconvolve(a, w, mode)
+
 @safeWrapper
 def convolve(sig, w, **kwargs):
     """1D convolution of neo.AnalogSignal sig with kernel "w".
@@ -5220,9 +5674,28 @@ def convolve(sig, w, **kwargs):
     
     Var-keyword parameters are passed on to the scipy.signal.convolve function,
     except for the "mode" which is always set to "same"
+    
+    The "method" keyword parameter may also be "oa", to use the overlap-add 
+    method (scipy.signal.oaconvolve). By default ("auto"), the overlap-add 
+    method is used for long signals convolved with kernels of 64 samples or 
+    more; otherwise scipy.signal.convolve chooses between direct and FFT 
+    convolution.
+    
+    Direct convolution ("direct", or "auto" with kernels shorter than 64 
+    samples) of floating point signals uses scipy.ndimage.convolve1d.
+    
+    For these two methods, a boxcar kernel (all elements equal) is applied as 
+    a running mean (scipy.ndimage.uniform_filter1d).
+    
+    With "auto", single-channel signals are convolved with numpy.convolve or
+    scipy.signal.fftconvolve, depending on the kernel size (see 
+    __fast_convolve1d__).
+    
+    All channels are convolved in one call.
     """
     
-    from scipy.signal import convolve
+    from scipy.signal import convolve, oaconvolve
+    from scipy.ndimage import convolve1d, uniform_filter1d
     
     name = kwargs.pop("name", "")
     
@@ -5230,21 +5703,42 @@ def convolve(sig, w, **kwargs):
     
     kwargs["mode"] = "same" # force "same" mode for convolution
     
-    if sig.shape[1] == 1:
-        ret = neo.AnalogSignal(convolve(sig.magnitude.flatten(), w, **kwargs),\
-                            units = sig.units, \
-                            t_start = sig.t_start, \
-                            sampling_period = sig.sampling_period,\
-                            name = "%s convolved" % sig.name)
+    method = kwargs.pop("method", "auto")
+    
+    # NOTE: a column vector kernel convolves each channel (column) of the 
+    # signal separately
+    w = np.asarray(w).flatten()
+    
+    if method in ("auto", "direct") and len(w) > 1 and w[0] != 0 and np.all(w == w[0]) and sig.dtype.kind == "f":
+        # NOTE: boxcar kernel: a scaled running mean, in O(N) whatever the 
+        # kernel size; for the "same" mode the zero padding and alignment 
+        # are those of scipy.signal.convolve
+        data = uniform_filter1d(sig.magnitude, size=len(w), axis=0, 
+                                mode="constant", cval=0.)
+        data *= w[0] * len(w)
+        
+    elif method == "auto" and sig.shape[1] == 1 and len(w) <= sig.shape[0]:
+        data = __fast_convolve1d__(sig.magnitude[:,0], w, kwargs["mode"])[:,np.newaxis]
+        
+    elif method == "oa" or (method == "auto" and len(w) >= 64 and sig.shape[0] >= 4 * len(w)):
+        data = oaconvolve(sig.magnitude, w[:,np.newaxis], axes=0, **kwargs)
+        
+    elif (method == "direct" or (method == "auto" and len(w) < 64)) and sig.dtype.kind == "f":
+        # NOTE: zero-padded direct convolution along the samples axis; the
+        # origin shift for even-sized kernels aligns the result with the 
+        # "same" mode of scipy.signal.convolve
+        data = convolve1d(sig.magnitude, w, axis=0, mode="constant", cval=0., 
+                          origin=(len(w)-1)//2 - len(w)//2)
         
     else:
-        csig = [convolve(sig[:,k].magnitude.flatten(), w, **kwargs)[:,np.newaxis] for k in range(sig.shape[1])]
+        data = convolve(sig.magnitude, w[:,np.newaxis], method=method, **kwargs)
         
-        ret = neo.AnalogSignal(np.concatenate(csig, axis=1),
-                               units = sig.units,
-                               t_start = sig.t_start,
-                               sampling_period = sig.sampling_period,
-                               name = "%s convolved" % sig.name)
+    ret = neo.AnalogSignal(data,
+                           units = sig.units,
+                           t_start = sig.t_start,
+                           sampling_period = sig.sampling_period,
+                           name = "%s convolved" % sig.name,
+                           copy = False)
         
     ret.annotations.update(sig.annotations)
     
@@ -5288,6 +5782,45 @@ def parse_acquisition_metadata(data:neo.Block, configuration:[type(None), dict]
     if "software" in data.annotations:
         pass
 
+def __two_means__(data:np.ndarray, bins:int=256) -> np.ndarray:
+    """Centroids of the two levels of a step waveform.
+    Helper for parse_step_waveform_signal
+    
+    In one dimension, Otsu's threshold (the split with the largest variance 
+    between the two classes) is also the split with the smallest within-class 
+    sum of squares, i.e. the two-means clustering of the samples. The threshold
+    is found on a histogram of the data, in one pass; the centroids are the 
+    means of the samples on either side of it.
+    
+    Returns a (2,1) array with the centroids in ascending order.
+    """
+    data = np.asarray(data, dtype=np.float64).ravel()
+    
+    h, edges = np.histogram(data, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2.
+    
+    # NOTE: class weights and sums for a split after each bin
+    w0 = np.cumsum(h)
+    w1 = w0[-1] - w0
+    s0 = np.cumsum(h * centers)
+    s1 = s0[-1] - s0
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = np.nan_to_num(w0 * w1 * (s0 / w0 - s1 / w1) ** 2)
+        
+    thr = edges[np.argmax(between[:-1]) + 1]
+    
+    low = data < thr
+    
+    if low.all() or not low.any():
+        c0 = c1 = data.mean()
+        
+    else:
+        c0 = data[low].mean()
+        c1 = data[~low].mean()
+        
+    return np.array([[c0], [c1]])
+
 @safeWrapper
 def parse_step_waveform_signal(sig, method="state_levels", **kwargs):
     """Parse a step waveform -- containing two states ("high" and "low").
@@ -5321,8 +5854,7 @@ def parse_step_waveform_signal(sig, method="state_levels", **kwargs):
         
         
     """
-    from scipy import cluster
-    from scipy.signal import boxcar
+    from scipy.ndimage import uniform_filter1d
     
     if not isinstance(sig, neo.AnalogSignal):
         raise TypeError("Expecting an analogsignal; got %s instead" % type(sig).__name__)
@@ -5333,8 +5865,11 @@ def parse_step_waveform_signal(sig, method="state_levels", **kwargs):
     box_size = kwargs.pop("box_size", 0)
     
     if box_size > 0:
-        window = boxcar(box_size)/box_size
-        sig_flt = convolve(sig, window)
+        # NOTE: running mean, in O(N); the zero padding at the edges is the 
+        # same as that of a boxcar convolution in "same" mode
+        sig_flt = __signal_like__(sig, uniform_filter1d(sig.magnitude, size=box_size, 
+                                                        axis=0, mode="constant", 
+                                                        cval=0.))
         #sig_flt = convolve(np.squeeze(sig), window, mode="same")
         #sig_flt = neo.AnalogSignal(sig_flt[:,np.newaxis], units = sig.units, t_start = sig.t_start, sampling_rate = 1/sig.sampling_period)
     else:
@@ -5363,17 +5898,30 @@ def parse_step_waveform_signal(sig, method="state_levels", **kwargs):
         centroids = np.array(centroids).T[:,np.newaxis]
         
     else:
-        centroids, distortion = cluster.vq.kmeans(sig_flt, 2)
-        centroids = np.sort(centroids, axis=0)
+        centroids = __two_means__(sig_flt.magnitude)
     
     #print(centroids)
     
-    label, dst = cluster.vq.vq(sig, centroids) # use un-filtered signal here
-    edlabel = np.ediff1d(label, to_begin=0)
+    # NOTE: with two 1D centroids the nearest centroid is given by which side
+    # of their midpoint a sample falls; this gives the same labels as 
+    # cluster.vq.vq(sig, centroids), with one comparison per sample
+    c0, c1 = centroids.ravel()[:2]
+    thr = (c0 + c1) / 2.
+    
+    data = sig.magnitude.ravel() # use un-filtered signal here
+    
+    label = (data > thr) if c1 > c0 else (data < thr)
+    label = label.view(np.int8)
+    
+    # NOTE: transitions are where the label changes; with two states, the 
+    # label after the change tells the direction
+    changes = np.flatnonzero(label[1:] != label[:-1]) + 1
+    
+    going_up = label[changes] == 1
     
-    down = sig.times[np.where(edlabel == -1)]
+    down = sig.times[changes[~going_up]]
     
-    up  = sig.times[np.where(edlabel == 1)]
+    up  = sig.times[changes[going_up]]
 
     # NOTE: 2017-08-31 23:04:26 FYI: depolarizing = down > up 
     # in current-clamp, a depolarizing current injection is an outward current 
@@ -5386,8 +5934,81 @@ def parse_step_waveform_signal(sig, method="state_levels", **kwargs):
     
     return down, up, amplitude, centroids, label
 
+def __uniform_pchip_slopes__(y:np.ndarray) -> np.ndarray:
+    """PCHIP derivatives for samples on a uniform grid with unit spacing.
+    Helper for __uniform_pchip__
+    
+    y: 2D array (samples, channels) with at least two samples.
+    
+    Same as the derivatives calculated by scipy.interpolate.PchipInterpolator,
+    where, on a uniform grid, the weighted harmonic mean of the slopes 
+    reduces to 2 * m[k-1] * m[k] / (m[k-1] + m[k]).
+    """
+    m = np.diff(y, axis=0)
+    
+    d = np.zeros_like(m, shape=y.shape, dtype=np.float64)
+    
+    if y.shape[0] == 2:
+        # NOTE: linear interpolation
+        d[:] = m[0]
+        return d
+    
+    m0 = m[:-1]
+    m1 = m[1:]
+    
+    same_sign = (np.sign(m0) == np.sign(m1)) & (m0 != 0) & (m1 != 0)
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d[1:-1] = np.where(same_sign, 2. * m0 * m1 / (m0 + m1), 0.)
+    
+    # NOTE: end points: one-sided, shape-preserving three-point estimates
+    for k, mk, mn in ((0, m[0], m[1]), (-1, m[-1], m[-2])):
+        dk = (3. * mk - mn) / 2.
+        
+        dk = np.where(np.sign(dk) != np.sign(mk), 0., dk)
+        dk = np.where((np.sign(mk) != np.sign(mn)) & (np.abs(dk) > np.abs(3. * mk)), 3. * mk, dk)
+        
+        d[k] = dk
+        
+    return d
+
+def __uniform_pchip__(y:np.ndarray, x:np.ndarray) -> np.ndarray:
+    """PCHIP interpolation of samples on a uniform grid.
+    Helper for resample_pchip
+    
+    y: 2D array (samples, channels) with at least two samples; the samples 
+        are at positions 0, 1, ..., len(y)-1
+    
+    x: 1D array of (fractional) sample positions where the interpolant is
+        evaluated; positions beyond the last sample take the value of the 
+        last sample
+        
+    Returns a 2D array (len(x), channels).
+    """
+    d = __uniform_pchip_slopes__(y)
+    
+    last = y.shape[0] - 1
+    
+    k = np.clip(np.floor(x).astype(np.intp), 0, last - 1)
+    t = (x - k)[:, np.newaxis]
+    
+    # NOTE: cubic Hermite basis on the unit interval
+    t2 = t * t
+    t3 = t2 * t
+    
+    h00 = 2. * t3 - 3. * t2 + 1.
+    h10 = t3 - 2. * t2 + t
+    h01 = -2. * t3 + 3. * t2
+    h11 = t3 - t2
+    
+    ret = h00 * y[k] + h10 * d[k] + h01 * y[k+1] + h11 * d[k+1]
+    
+    ret[x > last] = y[-1]
+    
+    return ret
+
 @safeWrapper
-def resample_pchip(sig, new_sampling_period, old_sampling_period = 1):
+def resample_pchip(sig, new_sampling_period, old_sampling_period = 1, polyphase = False):
     """Resample a signal using a piecewise cubic Hermite interpolating polynomial.
     
     Resampling is calculated using scipy.interpolate.PchipInterpolator, along the
@@ -5405,6 +6026,14 @@ def resample_pchip(sig, new_sampling_period, old_sampling_period = 1):
     old_sampling_period: float scalar or None (default)
         Must be specified when sig is a generic numpy ndarray or Quantity array.
         
+    polyphase: bool, default is False
+        When True, and sig is a neo.AnalogSignal or DataSignal, signals are 
+        resampled using polyphase filtering (scipy.signal.resample_poly) 
+        instead of PCHIP interpolation, whenever the ratio of the sampling 
+        periods is a fraction with a denominator <= 100; this is much faster,
+        but the resampled signal is low-pass filtered (anti-aliasing) and is
+        NOT shape-preserving (e.g. it may overshoot at steep transitions).
+        
     Returns:
     --------
     
@@ -5427,8 +6056,6 @@ def resample_pchip(sig, new_sampling_period, old_sampling_period = 1):
     # we replace these values wihtt he last signal sample value
     from scipy.interpolate import PchipInterpolator as pchip
     
-    from . import datatypes as dt
-    
     if isinstance(sig, (neo.AnalogSignal, DataSignal)):
         if isinstance(new_sampling_period, pq.Quantity):
             if not dt.units_convertible(new_sampling_period, sig.sampling_period):
@@ -5446,7 +6073,7 @@ def resample_pchip(sig, new_sampling_period, old_sampling_period = 1):
             
         elif sig.sampling_period < new_sampling_period:
             scale = new_sampling_period / sig.sampling_period
-            new_axis_len = int(np.floor(len(sig) // scale))
+            new_axis_len = int(np.floor(len(sig) / float(scale)))
             descr = "Downsampled"
             
         else: # no resampling required; return reference to signal
@@ -5459,12 +6086,34 @@ def resample_pchip(sig, new_sampling_period, old_sampling_period = 1):
         
         assert(np.isclose(new_step, float(new_sampling_period.magnitude)))
         
-        interpolator = pchip(sig.times.magnitude.flatten(), sig.magnitude.flatten(), 
-                             axis=0, extrapolate=False)
+        ratio = None
         
-        new_sig = interpolator(new_times)
-        
-        new_sig[np.isnan(new_sig)] = sig[-1,...]
+        if polyphase:
+            from fractions import Fraction
+            
+            # NOTE: new sampling rate / old sampling rate
+            rate_ratio = float(sig.sampling_period / new_sampling_period)
+            ratio = Fraction(rate_ratio).limit_denominator(100)
+            
+            if not np.isclose(float(ratio), rate_ratio, rtol=1e-9, atol=0):
+                ratio = None
+                
+        if ratio is not None:
+            from scipy.signal import resample_poly as resample
+            
+            new_sig = resample(sig.magnitude, ratio.numerator, ratio.denominator, 
+                               axis=0)[:new_axis_len]
+            
+        elif len(sig) > 1:
+            # NOTE: the samples are on a uniform grid: interpolate at the 
+            # (fractional) sample positions of the new time base
+            new_sig = __uniform_pchip__(sig.magnitude.reshape((len(sig), -1)), 
+                                        (new_times - sig.t_start.magnitude) / sig.sampling_period.magnitude)
+            
+        else:
+            # NOTE: a single sample: past the last sample the signal is 
+            # continued with its value
+            new_sig = np.repeat(sig.magnitude[-1:], new_axis_len, axis=0)
         
         ret = sig.__class__(new_sig, units=sig.units,
                             t_start = new_times[0]*sig.times.units,
@@ -5501,17 +6150,32 @@ def resample_pchip(sig, new_sampling_period, old_sampling_period = 1):
         
         t_stop = sig.shape[0] * old_sampling_period
         
-        new_times, new_step = np.linspace(sig.t_start.magnitude, sig.t_stop.magnitude, 
+        new_times, new_step = np.linspace(t_start, t_stop, 
                                           num=new_axis_len, retstep=True, endpoint=False)
         
-        assert(np.isclose(new_step,float(new_sampling_period.magnitude)))
+        assert(np.isclose(new_step,float(new_sampling_period)))
+        
+        data = sig.magnitude if isinstance(sig, pq.Quantity) else np.asarray(sig)
+        
+        # NOTE: the samples are on a uniform grid: interpolate on sample 
+        # indices, at the (fractional) sample positions of the new time base
+        x = np.arange(data.shape[0], dtype=np.float64)
+        
+        new_x = new_times / old_sampling_period
         
-        interpolator = pchip(sig.times.magnitude.flatten(), sig.magnitude.flatten(), 
-                             axis=0, extrapolate=False)
+        # NOTE: interpolate only up to the last sample, and continue the signal
+        # with the last sample value after it
+        n_valid = np.searchsorted(new_x, x[-1], side="right") if len(x) > 1 else 0
         
-        ret = interpolator(new_times)
+        ret = np.empty((new_axis_len, ) + data.shape[1:], 
+                       dtype = np.result_type(data.dtype, np.float64))
         
-        ret[np.isnan(ret)] = sig[-1, ...]
+        if n_valid > 0:
+            interpolator = pchip(x, data, axis=0, extrapolate=False)
+            
+            ret[:n_valid] = interpolator(new_x[:n_valid])
+        
+        ret[n_valid:] = data[-1, ...]
         
         return ret
 
@@ -5554,31 +6218,21 @@ def diff(sig, n=1, axis=-1, prepend=False, append=True):
         raise TypeError("Axis expected to be an int; got %s instead" % type(axis).__name__)
     
     # first, squeeze out the signal's sigleton dimensions
-    sig_data = np.array(sig).squeeze() # also copies the data; also we can use plain arrays
-    #sig_data = sig.magnitude.squeeze() # also copies the data
+    # NOTE: no copy here; np.diff below returns a new array
+    sig_data = np.asarray(sig.magnitude if hasattr(sig, "magnitude") else sig).squeeze()
     
+    # NOTE: np.take with a one-element index list selects the end sample and 
+    # keeps the axis, in one call
     if isinstance(append, bool):
         if append:
-            append_ndx = [slice(k) for k in sig_data.shape]
-            append_ndx[axis] = -1
-            
-            append_shape = [slice(k) for k in sig_data.shape]
-            append_shape[axis] = np.newaxis
-            
-            append = sig_data[tuple(append_ndx)][tuple(append_shape)]
+            append = np.take(sig_data, [-1], axis=axis)
             
         else:
             append = None
             
     if isinstance(prepend, bool):
         if prepend:
-            prepend_ndx = [slice(k) for k in sig_data.shape]
-            prepend_ndx[axis] = 0
-            
-            prepend_shape = [slice(k) for k in sig_data.shape]
-            prepend_shape[axis] = np.newaxis
-            
-            prepend = sig_data[tuple(prepend_ndx)][tuple(prepend_shape)]
+            prepend = np.take(sig_data, [0], axis=axis)
             
         else:
             prepend = None
@@ -5626,17 +6280,13 @@ def gradient(sig:[neo.AnalogSignal, DataSignal, np.ndarray],
     
     
     """
-    diffsig = np.array(sig) # for a neo.AnalogSignal this also copies the signal's magnitude
+    # NOTE: no copy here; the differences are calculated into a new array
+    diffsig = np.asarray(sig.magnitude if hasattr(sig, "magnitude") else sig)
     
-    if diffsig.ndim == 2:
-        for k in range(diffsig.shape[1]):
-            diffsig[:,k] = np.gradient(diffsig[:,k], n, axis=0)
-            
-        diffsig /= (n * sig.sampling_period.magnitude)
-            
-    elif diffsig.ndim == 1:
-        diffsig = np.gradient(diffsig, n, axis=0)
-        diffsig /= (n * sig.sampling_period.magnitude)
+    if diffsig.ndim in (1, 2):
+        # NOTE: all channels at once
+        # NOTE: the spacing in time units scales the central differences
+        diffsig = np.gradient(diffsig, n * sig.sampling_period.magnitude, axis=0)
             
     else:
         raise TypeError("'sig' has too many dimensions (%d); expecting 1 or 2" % diffsig.ndim)
@@ -5661,8 +6311,43 @@ def gradient(sig:[neo.AnalogSignal, DataSignal, np.ndarray],
     
     return ret
 
-    
-    
+    
+    
+def __ediff_columns__(data:np.ndarray, to_end=None, to_begin=None, scale=None) -> np.ndarray:
+    """Differences between consecutive rows of a 2D array, for all columns at once.
+    Helper for ediff1d
+    
+    Each column of the result is the same as numpy.ediff1d(data[:,k], 
+    to_end=to_end, to_begin=to_begin), where to_end and to_begin are scalars
+    or None.
+    
+    When scale is a scalar, the result (including to_end and to_begin) is 
+    multiplied by it, in place.
+    """
+    b = 0 if to_begin is None else 1
+    e = 0 if to_end is None else 1
+    
+    nRows = max(data.shape[0] - 1, 0)
+    
+    ret = np.empty((nRows + b + e, data.shape[1]), 
+                   dtype = np.result_type(data.dtype, np.float64))
+    
+    np.subtract(data[1:], data[:-1], out = ret[b:b+nRows])
+    
+    if scale is not None:
+        np.multiply(ret[b:b+nRows], scale, out = ret[b:b+nRows])
+        
+    else:
+        scale = 1.
+    
+    if b:
+        ret[0] = to_begin * scale
+        
+    if e:
+        ret[-1] = to_end * scale
+        
+    return ret
+
 @safeWrapper
 def ediff1d(sig:[neo.AnalogSignal, DataSignal, np.ndarray],
             to_end:numbers.Number=0, 
@@ -5689,19 +6374,22 @@ def ediff1d(sig:[neo.AnalogSignal, DataSignal, np.ndarray],
     
     """
     
-    diffsig = np.array(sig) # for a neo.AnalogSignal this also copies the signal's magnitude
+    # NOTE: no copy here; the differences are calculated into a new array
+    diffsig = np.asarray(sig.magnitude if hasattr(sig, "magnitude") else sig)
+    
+    # NOTE: scaling by the sampling period is done on the freshly calculated
+    # differences, in the same buffer
+    inv_dt = 1. / sig.sampling_period.magnitude
     
     if diffsig.ndim == 2:
-        for k in range(diffsig.shape[1]):
-            diffsig[:,k] = np.ediff1d(diffsig[:,k], to_end=to_end, to_begin=to_begin)# to_end = to_end, to_begin=to_begin)
+        # NOTE: all channels at once
+        diffsig = __ediff_columns__(diffsig, to_end=to_end, to_begin=to_begin, scale=inv_dt)
             
     elif diffsig.ndim == 1:
-        diffsig = np.ediff1d(diffsig, to_end=to_end, to_begin=to_begin)
+        diffsig = __ediff_columns__(diffsig[:,np.newaxis], to_end=to_end, to_begin=to_begin, scale=inv_dt)[:,0]
             
     else:
         raise TypeError("'sig' has too many dimensions (%d); expecting 1 or 2" % diffsig.ndim)
-        
-    diffsig /= sig.sampling_period.magnitude
     
     if isinstance(sig, DataSignal):
         ret = DataSignal(diffsig, units = sig.units / sig.times.units, 
@@ -5722,6 +6410,73 @@ def ediff1d(sig:[neo.AnalogSignal, DataSignal, np.ndarray],
     
     return ret
 
+if __has_numba__:
+    @numba.njit(parallel=True, cache=True)
+    def __n_diff_kernel__(a, n, inv_dt, n_begin, to_b, to_e, out):
+        """Scaled forward differences over n rows, for each column of a 2D array.
+        Writes into 'out', which has n_begin rows of to_b before the differences
+        and is filled with to_e after them.
+        """
+        rows, cols = a.shape
+        m = rows - n
+        
+        for j in numba.prange(cols):
+            for i in range(n_begin):
+                out[i, j] = to_b
+                
+            for i in range(m):
+                out[n_begin + i, j] = (a[i + n, j] - a[i, j]) * inv_dt
+                
+            for i in range(n_begin + m, out.shape[0]):
+                out[i, j] = to_e
+                
+def __n_diff_columns__(data:np.ndarray, n:int, inv_dt:float, 
+                       to_begin=None, to_end=None) -> np.ndarray:
+    """Forward differences over n samples for all columns of a 2D array, 
+    multiplied by inv_dt. Helper for forward_difference
+    
+    The result is padded with to_begin and/or to_end (when not None), also 
+    multiplied by inv_dt:
+    
+    * only to_end: n rows of to_end after the differences
+    * only to_begin: n rows of to_begin before the differences
+    * both: n//2 rows of to_begin before, and the remaining rows of to_end 
+        after the differences
+    * neither: no padding; the result has n fewer rows than data
+    
+    Uses a compiled, multi-threaded kernel when numba is available.
+    """
+    if to_begin is None:
+        n_begin = 0
+        n_end = 0 if to_end is None else n
+        
+    elif to_end is None:
+        n_begin = n
+        n_end = 0
+        
+    else:
+        n_begin = n//2
+        n_end = n - n_begin
+        
+    m = data.shape[0] - n
+    
+    to_b = 0. if to_begin is None else to_begin * inv_dt
+    to_e = 0. if to_end is None else to_end * inv_dt
+    
+    ret = np.empty((n_begin + m + n_end, data.shape[1]), 
+                   dtype = np.result_type(data.dtype, np.float64))
+    
+    if __has_numba__ and data.dtype in __numba_float_dtypes__:
+        __n_diff_kernel__(data, n, inv_dt, n_begin, to_b, to_e, ret)
+        return ret
+    
+    np.subtract(data[n:], data[:-n], out = ret[n_begin:n_begin+m])
+    ret[n_begin:n_begin+m] *= inv_dt
+    ret[:n_begin] = to_b
+    ret[n_begin+m:] = to_e
+    
+    return ret
+    
 @safeWrapper
 def forward_difference(sig:[neo.AnalogSignal, DataSignal, np.ndarray], 
                        n:int=1, 
@@ -5764,51 +6519,14 @@ def forward_difference(sig:[neo.AnalogSignal, DataSignal, np.ndarray],
     
     """
     
-    def __n_diff__(ary, n, to_b, to_e):
-        dsig = ary[n:] - ary[:-n]
-        
-        shp = [s for s in ary.shape]
-        
-        if to_end is not None:
-            if to_begin is None:
-                shp[0] = n
-                dsig = np.append(dsig, np.full(tuple(shp), to_e), axis=0)
-                
-            else:
-                to_start = n//2
-                to_stop = n - to_start
-                
-                shp[0] = to_start
-                dsig = np.insert(dsig, np.full(tuple(shp), to_b), axis=0)
-                
-                shp[0] = to_stop
-                dsig = np.append(dsig, np.full(tuple(shp), to_e), axis=0)
-                
-        else:
-            if to_end is None:
-                shp[0] = n
-                dsig = np.insert(dsig, np.full(tuple(shp), to_b), axis=0)
-                
-            else:
-                to_start = n//2
-                to_stop = n - to_start
-                
-                shp[0] = to_start
-                dsig = np.insert(dsig, np.full(tuple(shp), to_b), axis=0)
-                
-                shp[0] = to_stop
-                dsig = np.append(dsig, np.full(tuple(shp), to_e), axis=0)
-                
-        return dsig
-        
-    
     if not isinstance(n, int):
         raise TypeError("'n' expected to be an int; got %s instead" % type(n).__name__)
     
     if n < 0: 
         raise ValueError("'n' must be >= 0; got %d instead" % n)
     
-    diffsig = np.array(sig) # for a neo.AnalogSignal this also copies the signal's magnitude
+    # NOTE: no copy here; the differences are calculated into a new array
+    diffsig = np.asarray(sig.magnitude if hasattr(sig, "magnitude") else sig)
     
     if diffsig.ndim == 2:
         if n >= diffsig.shape[0]:
@@ -5817,17 +6535,14 @@ def forward_difference(sig:[neo.AnalogSignal, DataSignal, np.ndarray],
         if n == 0:
             return sig
         
-        elif n == 1:
-            for k in range(diffsig.shape[1]):
-                diffsig[:,k] = np.ediff1d(diffsig[:,k], to_end=to_end, to_begin=to_begin)# to_end = to_end, to_begin=to_begin)
-                
-            diffsig /= sig.sampling_period.magnitude
+        # NOTE: all channels at once, into a new array
+        if n == 1:
+            diffsig = __ediff_columns__(diffsig, to_end = to_end, to_begin = to_begin,
+                                        scale = 1. / sig.sampling_period.magnitude)
             
         else:
-            for k in range(diffsig.shape[1]):
-                diffsig[:,k] = __n_diff__(diffsig[:,k], n=n, to_e=to_end, to_b=to_begin)# to_end = to_end, to_begin=to_begin)
-            
-            diffsig /= (n * sig.sampling_period.magnitude)
+            diffsig = __n_diff_columns__(diffsig, n, 1. / (n * sig.sampling_period.magnitude),
+                                         to_begin = to_begin, to_end = to_end)
             
     elif diffsig.ndim == 1:
         if n >= len(diffsig):
@@ -5837,13 +6552,12 @@ def forward_difference(sig:[neo.AnalogSignal, DataSignal, np.ndarray],
             return sig
         
         elif n == 1:
-            diffsig = __n_diff__(diffsig, n=n, to_e = to_end, to_b = to_begin)
-            #diffsig = np.ediff1d(diffsig, to_end=to_end, to_begin=to_begin)
-            diffsig /= sig.sampling_period.magnitude
+            diffsig = __ediff_columns__(diffsig[:,np.newaxis], to_end = to_end, to_begin = to_begin,
+                                        scale = 1. / sig.sampling_period.magnitude)[:,0]
             
         else:
-                    
-            diffsig /= (n * sig.sampling_period.magnitude)
+            diffsig = __n_diff_columns__(diffsig[:,np.newaxis], n, 1. / (n * sig.sampling_period.magnitude),
+                                         to_begin = to_begin, to_end = to_end)[:,0]
             
     else:
         raise TypeError("'sig' has too many dimensions (%d); expecting 1 or 2" % diffsig.ndim)
@@ -5924,7 +6638,6 @@ def auto_detect_trigger_protocols(data:[ScanData, neo.Block],
     A list of trigger protocols
         
     """
-    from . import datatypes as dt
 
     if isinstance(data, ScanData):
         target = data.electrophysiology
@@ -5955,29 +6668,19 @@ def auto_detect_trigger_protocols(data:[ScanData, neo.Block],
     # we detect events in the whole signal or we limit detetion to a defined 
     # time-slice of the signal
     
-    if len(presynaptic) == 2:
-        auto_define_trigger_events(target, presynaptic[0], "presynaptic", label=presynaptic[1])
-        
-    elif len(presynaptic) == 3:
-        auto_define_trigger_events(target, presynaptic[0], "presynaptic", label=presynaptic[1], time_slice = presynaptic[2])
-        
-    if len(postsynaptic) == 2:
-        auto_define_trigger_events(target, postsynaptic[0], "postsynaptic", label = postsynaptic[1])
-        
-    elif len(postsynaptic) == 3:
-        auto_define_trigger_events(target, postsynaptic[0], "postsynaptic", label = postsynaptic[1], time_slice = postsynaptic[2])
-        
-    if len(photostimulation) == 2:
-        auto_define_trigger_events(target, photostimulation[0], "photostimulation", label=photostimulation[1])
-        
-    elif len(photostimulation) == 3:
-        auto_define_trigger_events(target, photostimulation[0], "photostimulation", label=photostimulation[1], time_slice = photostimulation[2])
-        
-    if len(imaging) == 2:
-        auto_define_trigger_events(target, imaging[0], "frame", label = imaging[1])
-        
-    elif len(imaging) == 3:
-        auto_define_trigger_events(target, imaging[0], "frame", label = imaging[1], time_slice = imaging[2])
+    # NOTE: the four detections run in this order, one after the other: they 
+    # all add (and may clear) events in the same segments of "target"
+    jobs = ((presynaptic,       "presynaptic"),
+            (postsynaptic,      "postsynaptic"),
+            (photostimulation,  "photostimulation"),
+            (imaging,           "frame"))
+    
+    for spec, event_type in jobs:
+        if len(spec) == 2:
+            auto_define_trigger_events(target, spec[0], event_type, label = spec[1])
+            
+        elif len(spec) == 3:
+            auto_define_trigger_events(target, spec[0], event_type, label = spec[1], time_slice = spec[2])
         
     #for s in target.segments:
         #s.annotations["trigger_protocol"] = "protocol"
@@ -6100,12 +6803,11 @@ def auto_define_trigger_events(src, analog_index, event_type,
     Side effects:
         Creates and appends TriggerEvent objects to the segments in src
     """
-    from . import datatypes as dt
     
     if isinstance(src, neo.Block):
         data = src.segments
         
-    elif isinstance(src, (tuple, list)) and all([isinstance(s, neo.Segment) for s in src]):
+    elif isinstance(src, (tuple, list)) and all(isinstance(s, neo.Segment) for s in src):
         data = src
         
     elif isinstance(src, neo.Segment):
@@ -6120,11 +6822,14 @@ def auto_define_trigger_events(src, analog_index, event_type,
         if not dt.check_time_units(times):  # event times passed at function call -- no detection is performed
             raise TypeError("times expected to have time units; it has %s instead" % times.units)
 
-        for segment in data: # construct eventss, store them in segments
-            event = TriggerEvent(times=times, units=times.units,
-                                    event_type=event_type, labels=label, 
-                                    name=name)
-            
+        # NOTE: one event object, embedded by reference in all segments (like 
+        # the events of a TriggerProtocol, see embed_trigger_protocol); 
+        # embed_trigger_event does not modify the event
+        event = TriggerEvent(times=times, units=times.units,
+                             event_type=event_type, labels=label, 
+                             name=name)
+        
+        for segment in data: # store the event in the segments
             embed_trigger_event(event, segment,
                                 clearTriggerEvents = clearTriggerEvents,
                                 clearSimilarEvents = clearSimilarEvents,
@@ -6136,6 +6841,10 @@ def auto_define_trigger_events(src, analog_index, event_type,
             # signal specified by name
             analog_index = get_index_of_named_signal(data, analog_index)
             
+        # NOTE: first collect the trigger signal of each segment
+        segments = list()
+        signals = list()
+        
         if isinstance(analog_index, (tuple, list)):
             if all(isinstance(s, (int, str)) for s in analog_index):
                 if len(analog_index) != len(data):
@@ -6148,56 +6857,78 @@ def auto_define_trigger_events(src, analog_index, event_type,
                     else:
                         sndx = ndx
                         
-                    if sndx in range(len(s.analogsignals)):
-                        if isinstance(time_slice, (tuple, list)) \
-                            and all([isinstance(t, pq.Quantity) and dt.check_time_units(t) for t in time_slice]) \
-                                and len(time_slice) == 2:
-                            event = detect_trigger_events(s.analogsignals[sndx].time_slice(time_slice[0], time_slice[1]), 
-                                                        event_type=event_type, 
-                                                        use_lo_hi=use_lo_hi, 
-                                                        label=label, name=name)
-                            
-                        else:
-                            event = detect_trigger_events(s.analogsignals[sndx], 
-                                                        event_type=event_type, 
-                                                        use_lo_hi=use_lo_hi, 
-                                                        label=label, name=name)
-                            
-                        embed_trigger_event(event, s, 
-                                            clearTriggerEvents = clearTriggerEvents,
-                                            clearSimilarEvents = clearSimilarEvents,
-                                            clearAllEvents = clearAllEvents)
-                        
-                    else:
-                        raise ValueError("Invalid signal index %d for a segment with %d analogsignals" % (ndx, len(s.analogsignals)))
-
+                    if sndx not in range(len(s.analogsignals)):
+                        raise ValueError("Invalid signal index %s for a segment with %d analogsignals" % (ndx, len(s.analogsignals)))
+                    
+                    segments.append(s)
+                    signals.append(s.analogsignals[sndx])
+                    
         elif isinstance(analog_index, int):
             for s in data:
-                if analog_index in range(len(s.analogsignals)):
-                    if isinstance(time_slice, (tuple, list)) \
-                        and all([isinstance(t, pq.Quantity) and dt.check_time_units(t) for t in time_slice]) \
-                            and len(time_slice) == 2:
-                        event = detect_trigger_events(s.analogsignals[analog_index].time_slice(time_slice[0], time_slice[1]), 
-                                                      event_type=event_type, 
-                                                      use_lo_hi=use_lo_hi, 
-                                                      label=label, name=name)
-                        
-                    else:
-                        event = detect_trigger_events(s.analogsignals[analog_index], 
-                                                      event_type=event_type, 
-                                                      use_lo_hi=use_lo_hi, 
-                                                      label=label, name=name)
-                        
-                    embed_trigger_event(event, s, 
-                                        clearTriggerEvents = clearTriggerEvents,
-                                        clearSimilarEvents = clearSimilarEvents,
-                                        clearAllEvents = clearAllEvents)
-                    
-                else:
+                if analog_index not in range(len(s.analogsignals)):
                     raise ValueError("Invalid signal index %d for a segment with %d analogsignals" % (analog_index, len(s.analogsignals)))
                 
+                segments.append(s)
+                signals.append(s.analogsignals[analog_index])
+                
         else:
             raise RuntimeError("Invalid signal index %s" % str(analog_index))
+        
+        # NOTE: time_slice is validated once, for all segments; the cheap 
+        # checks come first
+        use_time_slice = isinstance(time_slice, (tuple, list)) \
+            and len(time_slice) == 2 \
+                and all(isinstance(t, pq.Quantity) and dt.check_time_units(t) for t in time_slice)
+        
+        if use_time_slice:
+            t_start, t_stop = time_slice
+        
+        threshold = None
+        
+        if isinstance(analog_index, int) and len(signals) > 1 and signals[0].shape[1] == 1:
+            # NOTE: the same signal in all segments of one acquisition has the
+            # same low and high levels; take the threshold from the first 
+            # segment and use it for all, but only when the first segment 
+            # has transitions at that threshold and its range (high - low) 
+            # is at least half the range of every other segment, i.e. the 
+            # first segment is not just noise around a flat baseline; 
+            # otherwise each segment finds its own threshold
+            first = signals[0].time_slice(t_start, t_stop) if use_time_slice else signals[0]
+            
+            data = np.ravel(first.magnitude)
+            
+            lo, hi = data.min(), data.max()
+            
+            if hi > lo:
+                mid = (lo + hi) / 2.
+                
+                up, down = __trigger_edges__(data, mid)
+                
+                if len(up) or len(down):
+                    others = (sig.time_slice(t_start, t_stop) if use_time_slice else sig for sig in signals[1:])
+                    
+                    if all(np.ptp(o.magnitude) <= 2 * (hi - lo) for o in others):
+                        threshold = mid
+        
+        def __detect__(sig):
+            if use_time_slice:
+                sig = sig.time_slice(t_start, t_stop)
+                
+            return detect_trigger_events(sig, event_type=event_type, 
+                                         use_lo_hi=use_lo_hi, 
+                                         label=label, name=name,
+                                         threshold=threshold)
+        
+        # NOTE: detection only reads the signals, so it runs concurrently 
+        # (see __batch_map__): the edge scan is done by a numba kernel that 
+        # releases the GIL, when numba is available; the events are then 
+        # embedded one segment at a time, in segment order, because embedding
+        # modifies the segments' event lists
+        for s, event in zip(segments, __batch_map__(__detect__, signals)):
+            embed_trigger_event(event, s, 
+                                clearTriggerEvents = clearTriggerEvents,
+                                clearSimilarEvents = clearSimilarEvents,
+                                clearAllEvents = clearAllEvents)
 
     else:
         raise TypeError("times expected to be a python Quantity array with time units, or None")
@@ -6205,6 +6936,25 @@ def auto_define_trigger_events(src, analog_index, event_type,
                 
     return src
         
+def __drop_events__(events:list, drop:typing.Callable) -> None:
+    """Removes, in place, the elements of the list "events" for which drop(e) is True.
+    Helper for clear_events, remove_events and the embedding functions
+    
+    Unless most elements are removed, they are deleted one by one (last first,
+    so that each deletion only shifts the tail of the list) and the elements 
+    that are kept are neither copied nor re-validated by the container; 
+    otherwise (more than half of the elements) the list is rebuilt in one pass.
+    """
+    ndx = [k for k, e in enumerate(events) if drop(e)]
+    
+    if len(ndx) <= len(events) // 2:
+        for k in reversed(ndx):
+            del events[k]
+            
+    elif len(ndx):
+        dropped = set(ndx)
+        events[:] = [e for k, e in enumerate(events) if k not in dropped]
+
 def clear_events(src, triggersOnly=False, triggerType=None):
     """Shorthand for clearing neo.Event objects embedded in src.
     
@@ -6230,13 +6980,12 @@ def clear_events(src, triggersOnly=False, triggerType=None):
     
     
     """
-    from . import datatypes as dt
 
     if isinstance(src, neo.Block):
         target = src.segments
         #[s.events.clear() for s in src.segments];
         
-    elif isinstance(src, (tuple, list)) and all([isinstance(s, neo.Segment) for s in src]):
+    elif isinstance(src, (tuple, list)) and all(isinstance(s, neo.Segment) for s in src):
         target = src
         #[s.events.clear() for s in src]
         
@@ -6247,35 +6996,24 @@ def clear_events(src, triggersOnly=False, triggerType=None):
     else:
         raise TypeError("Expecting a neo.Block, a neo.Segment or a sequence of neo.Segment objects; got %s instead" % type(src).__name__)
     
+    # NOTE: events are filtered in one pass over each segment's events list
     for s in target:
-        all_events_ndx = range(len(s.events))
-        
-        trigs = []
-        
         if isinstance(triggerType, TriggerEventType):
-            trigs = [(endx, e) for (endx, e) in enumerate(s.events) if isinstance(e, TriggerEvent) and e.type & triggerType]
+            __drop_events__(s.events, lambda e: isinstance(e, TriggerEvent) and e.type & triggerType)
             
         elif triggersOnly:
-            trigs = [(endx, e) for (endx, e) in enumerate(s.events) if isinstance(e, TriggerEvent)]
-
-        if len(trigs):
-            (endx, evs) = zip(*trigs)
-            
-            keep_events = [s.events[k] for k in all_events_ndx if k not in endx]
-            
-            s.events[:] = keep_events
+            __drop_events__(s.events, lambda e: isinstance(e, TriggerEvent))
             
         else:
             s.events.clear()
                 
 @safeWrapper
 def get_non_empty_events(sequence:(tuple, list)):
-    from . import datatypes as dt
 
     if len(sequence) == 0:
         return list()
     
-    if not all([isinstance(e, (neo.Event, TriggerEvent)) for e in sequence]):
+    if not all(isinstance(e, (neo.Event, TriggerEvent)) for e in sequence):
         raise TypeError("Expecting a sequence containing only neo.Event or datatypes.TriggerEvent objects")
     
     return [e for e in sequence if len(e)]
@@ -6285,7 +7023,7 @@ def get_non_empty_spike_trains(sequence:(tuple, list)):
     if len(sequence) == 0:
         return list()
     
-    if not all([isinstance(e, neo.SpikeTrain) for e in sequence]):
+    if not all(isinstance(e, neo.SpikeTrain) for e in sequence):
         raise TypeError("Expecting a sequence containing only neo.SpikeTrain objects")
     
     return [s for s in sequence if len(s)]
@@ -6295,14 +7033,14 @@ def get_non_empty_epochs(sequence:(tuple, list)):
     if len(sequence) == 0:
         return list()
     
-    if not all([isinstance(e, neo.Epoch) for e in sequence]):
+    if not all(isinstance(e, neo.Epoch) for e in sequence):
         raise TypeError("Expecting a sequence containing only neo.Epoch objects")
     
     return [e for e in sequence if len(e)]
     
     
 @safeWrapper
-def detect_trigger_events(x, event_type, use_lo_hi=True, label=None, name=None):
+def detect_trigger_events(x, event_type, use_lo_hi=True, label=None, name=None, threshold=None):
     """Creates a datatypes.TriggerEvent object (array) of specified type.
     
     Calls detect_trigger_times(x) to detect the time stamps.
@@ -6328,23 +7066,24 @@ def detect_trigger_events(x, event_type, use_lo_hi=True, label=None, name=None):
     name: str, optional (default  None): the name of the generated 
         datatypes.TriggerEvent array
     
+    threshold: float, optional (default None): passed to detect_trigger_times()
+    
     Returns:
     ========
     
     A datatypes.TriggerEvent object (essentially an array of time stamps)
     
     """
-    from . import datatypes as dt
     
     if not isinstance(x, (neo.AnalogSignal, DataSignal, np.ndarray)):
         raise TypeError("Expecting a neo.AnalogSignal, or a datatypes.DataSignal, or a np.ndarray as first parameter; got %s instead" % type(x).__name__)
     
     if isinstance(event_type, str):
-        if event_type in list(TriggerEventType.__members__.keys()):
+        if event_type in __trigger_event_type_names__:
             event_type = TriggerEventType[event_type]
             
         else:
-            raise (ValueError("unknown trigger event type: %s; expecting one of %s" % event_type, " ".join(list([TriggerEventType.__members__.keys()]))))
+            raise ValueError("unknown trigger event type: %s; expecting one of %s" % (event_type, ", ".join(TriggerEventType.__members__)))
         
     elif not isinstance(event_type, TriggerEventType):
         raise TypeError("'event_type' expected to be a datatypes.TriggerEventType enum value, or a str in datatypes.TriggerEventType enum; got %s instead" % type(event_type).__name__)
@@ -6358,7 +7097,7 @@ def detect_trigger_events(x, event_type, use_lo_hi=True, label=None, name=None):
     if not isinstance(use_lo_hi, bool):
         raise TypeError("'use_lo_hi' parameter expected to be a boolean; got %s instead" % type(use_lo_hi).__name__)
     
-    [lo_hi, hi_lo] = detect_trigger_times(x)
+    [lo_hi, hi_lo] = detect_trigger_times(x, threshold=threshold)
     
     if use_lo_hi:
         times = lo_hi
@@ -6403,11 +7142,10 @@ def root_mean_square(x, axis = None):
         
         This argument is passed on to numpy.mean
         
-    Returns: a scalar float
+    Returns: a python Quantity (a scalar when axis is None), in the units of x
     RMS = sqrt(mean(x^2))
     
     """
-    from . import datatypes as dt
     
     if not isinstance(x, (neo.AnalogSignal, neo.IrregularlySampledSignal, DataSignal)):
         raise TypeError("Expecting a neo.AnalogSignal, neo.IrregularlySampledSignal, or a datatypes.DataSignal; got %s instead" % type(x).__name__)
@@ -6426,7 +7164,17 @@ def root_mean_square(x, axis = None):
         if axis < 0 or axis >= x.ndim:
             raise ValueError("Invalid axis index; expecting value between 0 and %d ; got %d instead" % (x.ndim, axis))
         
-    return np.sqrt(np.mean(np.abs(x), axis=axis))
+    data = x.magnitude
+    
+    if axis is None:
+        # NOTE: sum of squares as a dot product, without a temporary array
+        flat = data.ravel()
+        ms = np.dot(flat, flat) / flat.size
+        
+    else:
+        ms = np.mean(data * data, axis = tuple(axis) if isinstance(axis, list) else axis)
+        
+    return np.sqrt(ms) * x.units
     
 def signal_to_noise(x, axis=None, ddof=None, db=True):
     """Calculates SNR for the given signal.
@@ -6458,7 +7206,6 @@ def signal_to_noise(x, axis=None, ddof=None, db=True):
         When True, the result is expressed in decibel (10*log10(...))
         
     """
-    from . import datatypes as dt
 
     if not isinstance(x, (neo.AnalogSignal, neo.IrregularlySampledSignal, DataSignal)):
         raise TypeError("Expecting a neo.AnalogSignal, neo.IrregularlySampledSignal, or a datatypes.DataSignal; got %s instead" % type(x).__name__)
@@ -6495,14 +7242,15 @@ def signal_to_noise(x, axis=None, ddof=None, db=True):
             raise ValueError("ddof must be >= 0; got %s instead" % ddof)
         
         
-    rms = root_mean_square(x, axis=axis)
+    # NOTE: the ratio is dimensionless; work on the magnitudes
+    rms = root_mean_square(x, axis=axis).magnitude
     
-    std = np.std(x, axis=axis, ddof=ddof)
+    std = np.std(x.magnitude, axis = tuple(axis) if isinstance(axis, list) else axis, ddof=ddof)
     
     ret = rms/std
     
     if db:
-        return np.log10(ret.magnitude.flatten()) * 20 
+        return np.log10(np.ravel(ret)) * 20 
     
     return ret
     
@@ -6511,7 +7259,55 @@ def signal_to_noise(x, axis=None, ddof=None, db=True):
 
 
 #@safeWrapper
-def detect_trigger_times(x):
+if __has_numba__:
+    @numba.njit(cache=True, nogil=True)
+    def __trigger_edges_kernel__(data, thr):
+        """Indices of the samples after which data crosses thr upwards and 
+        downwards, in one pass over data.
+        """
+        lo_hi = np.empty(data.shape[0], dtype=np.int64)
+        hi_lo = np.empty(data.shape[0], dtype=np.int64)
+        
+        n_lo_hi = 0
+        n_hi_lo = 0
+        
+        if data.shape[0] == 0:
+            return lo_hi[:0], hi_lo[:0]
+        
+        prev_hi = data[0] > thr
+        
+        for k in range(1, data.shape[0]):
+            hi = data[k] > thr
+            
+            if hi and not prev_hi:
+                lo_hi[n_lo_hi] = k - 1
+                n_lo_hi += 1
+                
+            elif prev_hi and not hi:
+                hi_lo[n_hi_lo] = k - 1
+                n_hi_lo += 1
+                
+            prev_hi = hi
+            
+        return lo_hi[:n_lo_hi].copy(), hi_lo[:n_hi_lo].copy()
+    
+def __trigger_edges__(data:np.ndarray, thr:float) -> tuple:
+    """Indices of the low to high and high to low transitions in a 1D array.
+    Helper for detect_trigger_times
+    
+    A sample is "high" when it is above thr. An index k in the result means 
+    that the transition happens between samples k and k+1.
+    
+    Uses a compiled kernel when numba is available.
+    """
+    if __has_numba__ and data.dtype in __numba_float_dtypes__:
+        return __trigger_edges_kernel__(data, thr)
+    
+    diffcode = np.diff((data > thr).view(np.int8))
+    
+    return np.flatnonzero(diffcode == 1), np.flatnonzero(diffcode == -1)
+
+def detect_trigger_times(x, robust=False, threshold=None):
     """Detect and returns the time stamps of rectangular pulse waveforms in a neo.AnalogSignal
     
     The signal must undergo at least one transition between two distinct states 
@@ -6520,37 +7316,67 @@ def detect_trigger_times(x):
     The function is useful in detecting the ACTUAL time of a trigger (be it 
     "emulated" in the ADC command current/voltage or in the digital output "DIG") 
     when this differs from what was intended in the protocol (e.g. in Clampex)
+    
+    Named parameters:
+    ================
+    robust: bool, default is False
+        When False, the samples of a single-channel signal are classified as 
+        "low" or "high" by a threshold halfway between the signal's minimum 
+        and maximum; this is enough for rectangular (TTL) pulses.
+        
+        When True (or when the signal has several channels) the two states are
+        found by k-means clustering (scipy.cluster.vq.kmeans), which is slower
+        but less sensitive to noise and outliers.
+        
+    threshold: float or None (default)
+        When a float (in the units of x) and x has one channel, samples above
+        it are "high" and the others "low"; "robust" is then ignored. This is 
+        useful to apply the same levels to several signals from one acquisition.
+        
+    Returns:
+    =======
+    A tuple of quantity arrays (lo_hi, hi_lo) with the times of the low to high
+    and high to low transitions, respectively; either can be None when there
+    are no such transitions.
     """
     from scipy import cluster
-    from scipy import signal
     
     #flt = signal.firwin()
     
     if not isinstance(x, neo.AnalogSignal):
         raise TypeError("Expecting a neo.AnalogSignal object; got %s instead" % type(x).__name__)
     
-    # WARNING: algorithm fails for noisy signls with no TTL waveform!
-    cbook, dist = cluster.vq.kmeans(x, 2)
-    
-    #print("code_book: ", cbook)
-    
-    #print("sorted code book: ", sorted(cbook))
-    
-    code, cdist = cluster.vq.vq(x, sorted(cbook))
-    
-    diffcode = np.diff(code)
-    
-    ndx_lo_hi = np.where(diffcode ==  1)[0].flatten() # transitions from low to high
-    ndx_hi_lo = np.where(diffcode == -1)[0].flatten() # hi -> lo transitions
+    if threshold is not None and x.shape[1] == 1:
+        ndx_lo_hi, ndx_hi_lo = __trigger_edges__(x.magnitude.ravel(), threshold)
+        
+    elif robust or x.shape[1] > 1:
+        # WARNING: algorithm fails for noisy signls with no TTL waveform!
+        cbook, dist = cluster.vq.kmeans(x, 2)
+        
+        #print("code_book: ", cbook)
+        
+        #print("sorted code book: ", sorted(cbook))
+        
+        code, cdist = cluster.vq.vq(x, sorted(cbook))
+        
+        diffcode = np.diff(code)
+        
+        ndx_lo_hi = np.flatnonzero(diffcode ==  1) # transitions from low to high
+        ndx_hi_lo = np.flatnonzero(diffcode == -1) # hi -> lo transitions
+        
+    else:
+        data = x.magnitude.ravel()
+        
+        ndx_lo_hi, ndx_hi_lo = __trigger_edges__(data, (data.min() + data.max()) / 2.)
     
     if ndx_lo_hi.size:
-        times_lo_hi = [x.times[k] for k in ndx_lo_hi]
+        times_lo_hi = x.times[ndx_lo_hi]
         
     else:
         times_lo_hi = None
         
     if ndx_hi_lo.size:
-        times_hi_lo = [x.times[k] for k in ndx_hi_lo]
+        times_hi_lo = x.times[ndx_hi_lo]
         
     else:
         times_hi_lo = None
@@ -6558,7 +7384,6 @@ def detect_trigger_times(x):
     return times_lo_hi, times_hi_lo
 
 def remove_trigger_protocol(protocol, block):
-    from . import datatypes as dt
 
     if not isinstance(protocol, TriggerProtocol):
         raise TypeError("'protocol' expected to be a TriggerProtocol; got %s instead" % type(protocol).__name__)
@@ -6592,7 +7417,6 @@ def modify_trigger_protocol(protocol, block):
     Uses the events in the protocol to add TriggerEvents or modify exiting ones,
     in the segment indices specified by this protocol's segment indices.
     """
-    from . import datatypes as dt
 
     if not isinstance(protocol, TriggerProtocol):
         raise TypeError("'value' expected to be a TriggerProtocol; got %s instead" % type(value).__name__)
@@ -6606,6 +7430,23 @@ def modify_trigger_protocol(protocol, block):
     else:
         protocol_segments = range(len(block.segments))
         
+    # NOTE: the protocol's events that go into each segment, and their types;
+    # an event replaces any event of the same type that came before it
+    candidates = [e for (e, etype) in ((protocol.presynaptic, TriggerEventType.presynaptic),
+                                       (protocol.postsynaptic, TriggerEventType.postsynaptic),
+                                       (protocol.photostimulation, TriggerEventType.photostimulation))
+                  if isinstance(e, TriggerEvent) and e.event_type == etype]
+    
+    candidates.extend(protocol.acquisition)
+    
+    protocol_events = list()
+    
+    for event in candidates:
+        protocol_events = [e for e in protocol_events if e.event_type != event.event_type]
+        protocol_events.append(event)
+        
+    protocol_event_types = set(e.event_type for e in protocol_events)
+    
     for k in protocol_segments:
         if k >= len(block.segments):
             warnings.warn("skipping segment index %d of protocol %s because it points outside the list of segments with %d elements" % (k, protocol.name, len(block.segments)), 
@@ -6619,40 +7460,13 @@ def modify_trigger_protocol(protocol, block):
         # check if the segment has any events of the type found in the protocol
         # remove them and add the protocol's events instead
         # NOTE: ONE segment -- ONE protocol at all times.
-        if isinstance(protocol.presynaptic, TriggerEvent) and protocol.presynaptic.event_type == TriggerEventType.presynaptic:
-            presynaptic_events = [e for e in block.segments[k].events if isinstance(e, TriggerEvent) and e.event_type == TriggerEventType.presynaptic]
-            
-            for event in presynaptic_events:
-                # should contain AT MOST ONE event object
-                block.segments[k].events.remove(event)
-                
-            block.segments[k].events.append(protocol.presynaptic)
-                
-        if isinstance(protocol.postsynaptic, TriggerEvent) and protocol.postsynaptic.event_type == TriggerEventType.postsynaptic:
-            postsynaptic_events = [e for e in block.segments[k].events if isinstance(e, TriggerEvent) and e.event_type == TriggerEventType.postsynaptic]
-            
-            for event in postsynaptic_events:
-                block.segments[k].events.remove(event)
-                
-            block.segments[k].events.append(protocol.postsynaptic)
-            
-            
-        if isinstance(protocol.photostimulation, TriggerEvent) and protocol.photostimulation.event_type == TriggerEventType.photostimulation:
-            photostimulation_events = [e for e in block.segments[k].events if isinstance(e, TriggerEvent) and e.event_type == TriggerEventType.photostimulation]
-            
-            for event in photostimulation_events:
-                block.segments[k].events.remove(event)
-                
-            block.segments[k].event.append(protocol.photostimulation)
+        # NOTE: one pass over the segment's events (see protocol_events and 
+        # protocol_event_types, above)
+        if len(protocol_events):
+            __drop_events__(block.segments[k].events, 
+                            lambda e: isinstance(e, TriggerEvent) and e.event_type in protocol_event_types)
             
-        if len(protocol.acquisition):
-            for event in protocol.acquisition:
-                existing_events = [e for e in block.segments[k].events if isinstance(e, TriggerEvent) and e.event_type == event.event_type]
-                
-                for e in existing_events:
-                    block.segments[k].events.remove(e)
-                    
-                block.segments[k].events.append(event)
+            block.segments[k].events.extend(protocol_events)
                 
         if isinstance(protocol.name, str) and len(protocol.name.strip()) > 0:
             pr_name = protocol.name
@@ -6696,7 +7510,6 @@ def remove_events(event, segment, byLabel=True):
         Otherwise, _ALL_ events with name given by "event" parameter will be removed,
             if found.
     """
-    from . import datatypes as dt
 
     if not isinstance(segment, neo.Segment):
         raise TypeError("segment expected to be a neo.Segment; got %s instead" % type(segment).__name__)
@@ -6710,47 +7523,21 @@ def remove_events(event, segment, byLabel=True):
             del segment.events[evindex]
             
         else: # find events stored in event list that have same attributes as event
-            evs = [(k,e) for (k,e) in enumerate(segment.events) if e.is_same_as(event)]
-            
-            if len(evs):
-                (evndx, events) = zip(*evs)
-                all_events_ndx = range(len(segment.events))
-                
-                keep_events = [segment.events[k] for k in all_events_ndx if k not in evndx]
-                
-                segment.events[:] = keep_events
+            __drop_events__(segment.events, lambda e: e.is_same_as(event))
                 
     elif isinstance(event, int):
-        if event in range(len(segment.events)):
+        if 0 <= event < len(segment.events):
             del segment.events[event]
             
     elif isinstance(event, str):
-        evs = []
-        
         if byLabel:
-            evs = [(k,e) for (k,e) in segment.events if np.any(e.labels == event)]
+            __drop_events__(segment.events, lambda e: np.any(e.labels == event))
             
         else:
-            evs = [(k,e) for (k,e) in segment.events if e.name == event]
-            
-        if len(evs):
-            (evndx, events) = zip(*evs)
-            all_events_ndx = range(len(segment.events))
-            
-            keep_events = [segment.events[k] for k in all_events_ndx if k not in evndx]
-            
-            segment.events[:] = keep_events
+            __drop_events__(segment.events, lambda e: e.name == event)
             
     elif isinstance(event, TriggerEventType):
-        evs = [(k,e) for (k,e) in segment.events if isinstance(e, TriggerEvent) and e.type & event]
-
-        if len(evs):
-            (evndx, events) = zip(*evs)
-            all_events_ndx = range(len(segment.events))
-            
-            keep_events = [segment.events[k] for k in all_events_ndx if k not in evndx]
-            
-            segment.events[:] = keep_events
+        __drop_events__(segment.events, lambda e: isinstance(e, TriggerEvent) and e.type & event)
             
     else:
         raise TypeError("event expected to be a neo.Event, an int, a str or a datatypes.TriggerEventType; got %s instead" % type(event).__name__)
@@ -6813,7 +7600,6 @@ def embed_trigger_event(event, segment, clearSimilarEvents=True, clearTriggerEve
     A reference to the segment.
     
     """
-    from . import datatypes as dt
     
     if not isinstance(event, (neo.Event, TriggerEvent)):
         raise TypeError("event expected to be a neo.Event; got %s instead" % type(event).__name__)
@@ -6824,22 +7610,11 @@ def embed_trigger_event(event, segment, clearSimilarEvents=True, clearTriggerEve
     if clearAllEvents:
         segment.events.clear()
         
-    else:
-        all_events_ndx = range(len(segment.events))
-        evs = []
-    
-        if clearSimilarEvents:
-            evs = [(k,e) for (k,e) in enumerate(segment.events) if is_same_as(event, e)]
-            
-        elif clearTriggerEvents:
-            evs = [(k,e) for (k,e) in enumerate(segment.events) if isinstance(e, TriggerEvent)]
-            
-        if len(evs):
-            (evndx, events) = zip(*evs)
-            
-            keep_events = [segment.events[k] for k in all_events_ndx if k not in evndx]
-            
-            segment.events[:] = keep_events
+    elif clearSimilarEvents:
+        __drop_events__(segment.events, lambda e: is_same_as(event, e))
+        
+    elif clearTriggerEvents:
+        __drop_events__(segment.events, lambda e: isinstance(e, TriggerEvent))
             
     segment.events.append(event)
     
@@ -6878,7 +7653,6 @@ def embed_trigger_protocol(protocol, target, useProtocolSegments=True, clearTrig
     CAUTION: This will wipe out existing trigger events in those segments
     indicated by the 'segmentIndices' attribute of 'protocol'.
     """
-    from . import datatypes as dt
 
     # check if there are synaptic events already in the scans data target:
     # each segment can hold at most one TriggerEvent object of each 
@@ -6895,8 +7669,7 @@ def embed_trigger_protocol(protocol, target, useProtocolSegments=True, clearTrig
         segments = target.segments
         
         if len(protocol.segmentIndices()) > 0:
-            value_segments = [i for i in protocol.segmentIndices() if i in range(len(segments))]
-            value_segments = protocol.segmentIndices()
+            value_segments = [i for i in protocol.segmentIndices() if 0 <= i < len(segments)]
             
         else:
             value_segments = range(len(segments))
@@ -6917,8 +7690,7 @@ def embed_trigger_protocol(protocol, target, useProtocolSegments=True, clearTrig
         else:
             # the list of segments 
             if len(protocol.segmentIndices()) > 0:
-                value_segments = [i for i in protocol.segmentIndices() if i in range(len(segments))]
-                value_segments = protocol.segmentIndices()
+                value_segments = [i for i in protocol.segmentIndices() if 0 <= i < len(segments)]
                 
             else:
                 value_segments = range(len(segments))
@@ -6936,19 +7708,23 @@ def embed_trigger_protocol(protocol, target, useProtocolSegments=True, clearTrig
         return
         
     #print("embed_trigger_protocol: value_segments ", value_segments, " target segments: %d" % len(target.segments))
+    
+    protocol_events = list()
+    
+    if isinstance(protocol.acquisition, (tuple, list)) and len(protocol.acquisition):
+        # for old API
+        protocol_events.append(protocol.acquisition[0]) # only ONE acquisition event per protocol!
+        
+    elif isinstance(protocol.acquisition, TriggerEvent):
+        protocol_events.append(protocol.acquisition)
+        
+    protocol_events.extend(e for e in (protocol.presynaptic, 
+                                       protocol.postsynaptic, 
+                                       protocol.photostimulation) if e is not None)
         
     for k in value_segments: 
         if clearTriggers:
-            trigs = [(evndx, ev) for (evndx, ev) in enumerate(segments[k].events) if isinstance(ev, TriggerEvent)]
-
-            if len(trigs): # TriggerEvent objects found in segment
-                (trigndx, trigevs) = zip(*trigs)
-                
-                all_events_ndx = range(len(segments[k].events))
-                
-                keep_events = [segments[k].events[i] for i in all_events_ndx if i not in trigndx]
-                
-                segments[k].events[:] = keep_events
+            __drop_events__(segments[k].events, lambda e: isinstance(e, TriggerEvent))
                 
         elif clearEvents:
             segments[k].events.clear()
@@ -6957,21 +7733,9 @@ def embed_trigger_protocol(protocol, target, useProtocolSegments=True, clearTrig
         
         #print("embed_trigger_protocol: in %s (segment %d): protocol.name %s; acquisition: %s" % (target.name, k, protocol.name, protocol.acquisition))
         
-        if isinstance(protocol.acquisition, (tuple, list)) and len(protocol.acquisition):
-            # for old API
-            segments[k].events.append(protocol.acquisition[0]) # only ONE acquisition event per protocol!
-                
-        elif isinstance(protocol.acquisition, TriggerEvent):
-            segments[k].events.append(protocol.acquisition)
-                
-        if protocol.presynaptic is not None:
-                segments[k].events.append(protocol.presynaptic)
-            
-        if protocol.postsynaptic is not None:
-                segments[k].events.append(protocol.postsynaptic)
-            
-        if protocol.photostimulation is not None:
-                segments[k].events.append(protocol.photostimulation)
+        # NOTE: the protocol events are the same for every segment; they are
+        # collected once, before this loop, and added with a single extend()
+        segments[k].events.extend(protocol_events)
                                 
         if isinstance(protocol.name, str) and len(protocol.name.strip()) > 0:
             pr_name = protocol.name
@@ -7004,12 +7768,11 @@ def is_same_as(e1, e2, rtol = 1e-4, atol =  1e-4, equal_nan = True):
     equal_nan: boolean default is True (see numpy.isclose())
     
     """
-    from . import datatypes as dt
 
-    if any([not isinstance(e, neo.Event) for e in (e1,e2)]):
+    if any(not isinstance(e, neo.Event) for e in (e1,e2)):
         return False
     
-    if all([isinstance(e, TriggerEvent) for e in (e1,e2)]):
+    if all(isinstance(e, TriggerEvent) for e in (e1,e2)):
         return e1.is_same_as(e2)
     
     compatible_units = e1.units == e2.units
@@ -7027,47 +7790,147 @@ def is_same_as(e1, e2, rtol = 1e-4, atol =  1e-4, equal_nan = True):
             except AssertionError:
                 compatible_units = False
             
-    result = compatible_units
+    # NOTE: return as soon as a check fails; the cheap checks go first
+    if not compatible_units:
+        return False
     
-    if result:
-        result &= e2.times.flatten().size == e1.times.flatten().size
+    if e1.name != e2.name:
+        return False
     
-    if result:
-        result &= np.all(np.isclose(e2.times.magnitude, e1.times.magnitude,
-                                    rtol=rtol, atol=atol,equal_nan=equal_nan))
+    if e2.times.size != e1.times.size:
+        return False
     
-    if result: 
-        result &= np.all(np.isclose(e2.magnitude, e1.magnitude, 
-                                    rtol=rtol, atol=atol, equal_nan=equal_nan))
-        
-    if result:
-        result &= e2.labels.flatten().size == e1.labels.flatten().size
-        
-    if result:
-        result &= np.all(e2.labels.flatten() == e2.labels.flatten)
-        
-    if result:
-        result &= e1.name == e2.name
+    if e2.labels.size != e1.labels.size:
+        return False
+    
+    if not np.allclose(e2.times.magnitude, e1.times.magnitude,
+                       rtol=rtol, atol=atol, equal_nan=equal_nan):
+        return False
+    
+    if not np.allclose(e2.magnitude, e1.magnitude, 
+                       rtol=rtol, atol=atol, equal_nan=equal_nan):
+        return False
         
-    return result
+    return np.array_equal(e1.labels.ravel(), e2.labels.ravel())
     
         
 def generate_text_stimulus_file(spike_times, start, duration, sampling_frequency, 
                          spike_duration, spike_value, filename,
                          atol=1e-12, rtol=1e-12, skipInvalidTimes=True,
-                         maxSweepDuration=None):
+                         maxSweepDuration=None, dtype=float):
     
     spike_trace = generate_spike_trace(spike_times, start, duration, sampling_frequency, 
-                         spike_duration, spike_value, asNeoSignal=False)
+                         spike_duration, spike_value, asNeoSignal=False, 
+                         dtype=dtype)
     
     np.savetxt(filename, spike_trace)
     
     
+def __spike_trace_indices__(n_samples:int, i0:int, t_origin:float, 
+                            sp_times:np.ndarray, t0:float, t_duration:float, 
+                            s_freq:float, skip_invalid:bool, 
+                            atol:float, rtol:float) -> np.ndarray:
+    """Indices of the samples in a trace where the spikes at sp_times start.
+    Helper for generate_spike_trace and generate_ripple_trace
+    
+    The trace has n_samples samples taken with sampling frequency s_freq; 
+    its first sample is sample i0 of a time base starting at t_origin, i.e., 
+    sample k of the trace is at t_origin + (i0 + k) / s_freq. The time base 
+    itself is not created.
+    
+    Spike times are truncated to the resolution given by the order of magnitude
+    of s_freq, then converted to sample indices by rounding; the time of the 
+    sample found must be close to the truncated time (see numpy.isclose for 
+    atol and rtol).
+    
+    When skip_invalid is True, spike times outside [t0, t0 + t_duration] are
+    skipped.
+    
+    Raises RuntimeError when a spike time is not found in the trace, or when it
+    is ambiguous (i.e. more than one sample is close to it).
+    """
+    sp_times = np.asarray(sp_times, dtype=np.float64).ravel()
+    
+    if skip_invalid:
+        sp_times = sp_times[(sp_times >= t0) & (sp_times <= t0 + t_duration)]
+        
+    if sp_times.size == 0:
+        return np.empty(0, dtype=np.intp)
+        
+    order = int(np.log10(s_freq))
+    
+    pwr = 10. ** order
+    
+    clipped = np.trunc(sp_times * pwr) / pwr
+    
+    step = 1 / s_freq
+    
+    ndx = np.rint((clipped - t_origin) * s_freq).astype(np.intp) - i0
+    
+    def __close_at__(index):
+        valid = (index >= 0) & (index < n_samples)
+        ret = np.zeros(index.shape, dtype=bool)
+        ret[valid] = np.isclose(t_origin + (i0 + index[valid]) * step, clipped[valid], atol=atol, rtol=rtol)
+        return ret
+    
+    found = __close_at__(ndx)
+    
+    if not found.all():
+        k = np.flatnonzero(~found)[0]
+        raise RuntimeError("spike time %g not found in the times array given start: %g, duration: %g, sampling frequency: %g and tolerances (atol: %g, rtol: %g). \nConsider increasing the tolerances or changing start and /or duration." \
+            % (sp_times[k], t0, t_duration, s_freq, atol, rtol))
+    
+    # NOTE: sample times are monotonic: a spike time is ambiguous when a neighbour 
+    # of the sample found is also close to it
+    ambiguous = __close_at__(ndx - 1) | __close_at__(ndx + 1)
+    
+    if ambiguous.any():
+        k = np.flatnonzero(ambiguous)[0]
+        raise RuntimeError("ambiguous spike time found for %g, given start: %g, duration: %g, sampling frequency: %g and tolerances (atol: %g, rtol: %g). \nConsider decreasing the tolerances" \
+            % (sp_times[k], t0, t_duration, s_freq, atol, rtol))
+    
+    return ndx
+
+if __has_numba__:
+    @numba.njit(cache=True)
+    def __fill_pulses_kernel__(out, starts, width, value):
+        """Writes value into width samples of out, from each index in starts, 
+        in place.
+        """
+        n = out.shape[0]
+        
+        for i in range(starts.shape[0]):
+            j0 = starts[i]
+            
+            for k in range(width):
+                j = j0 + k
+                
+                if j >= 0 and j < n:
+                    out[j] = value
+                    
+def __fill_pulses__(trace:np.ndarray, starts:np.ndarray, width:int, value:float) -> None:
+    """Sets "width" samples of trace to value, from each index in starts.
+    Helper for generate_spike_trace and generate_ripple_trace
+    
+    Pulses are truncated at the end of the trace.
+    
+    Uses a compiled kernel, writing directly into trace, when numba is 
+    available; otherwise the indices of all pulse samples are broadcast into 
+    a temporary array.
+    """
+    if __has_numba__ and trace.ndim == 1 and trace.dtype in __numba_float_dtypes__:
+        __fill_pulses_kernel__(trace, np.asarray(starts, dtype=np.int64), int(width), float(value))
+        return
+    
+    idx = (np.asarray(starts, dtype=np.intp)[:,np.newaxis] + np.arange(width)[np.newaxis,:]).ravel()
+    
+    trace[idx[(idx >= 0) & (idx < trace.size)]] = value
+
 def generate_ripple_trace(ripple_times, start, duration, sampling_frequency,
                           spike_duration=0.001, spike_value=5000, 
                           spike_count=5, spike_isi=0.01,
                           filename=None, atol=1e-12, rtol=1e-12, 
-                          skipInvalidTimes=True):
+                          skipInvalidTimes=True, dtype=float):
     """Similar as generate_spike_trace and generate_text_stimulus_file combined.
     
     However, ripple times are the t_start values for ripple events. In turn,
@@ -7099,57 +7962,26 @@ def generate_ripple_trace(ripple_times, start, duration, sampling_frequency,
         
     filename = None (default) or a str (name of file where the trace will be written as ASCII)
     
-    atol, rtol, skipInvalidTimes: see generate_spike_trace
+    atol, rtol, skipInvalidTimes, dtype: see generate_spike_trace
     
     """
     
-    def __inner_generate_ripples__(t_array, sp_times, t0, t_duration, 
+    def __inner_generate_ripples__(n_samples, sp_times, t0, t_duration, 
                                  s_freq, skip_invalid, atol_, rtol_):
         
-        #print(sp_times)
-        #print("t_duration", t_duration)
+        ripple_trace = np.zeros(n_samples, dtype=dtype)
         
-        ripple_trace = np.full_like(t_array, 0.0)
+        # NOTE: all spikes of all ripples at once: the start of each spike is
+        # offset from the start of its ripple by a multiple of the isi
+        ndx = __spike_trace_indices__(n_samples, 0, t0, sp_times, t0, t_duration, 
+                                      s_freq, skip_invalid, atol_, rtol_)
         
-        order = int(np.log10(s_freq))
+        stride = int(spike_isi * s_freq)
         
-        pwr = eval("1e%d" % order)
+        starts = ndx[:,np.newaxis] + stride * np.arange(spike_count)[np.newaxis,:]
         
-        for k, ripple_time in enumerate(list(sp_times)):
-            # generate spike train for one ripple
-            #print("k, ripple_time", k, ripple_time)
-            if skip_invalid:
-                if ripple_time < start or ripple_time > (t0+t_duration):
-                    continue
-                
-            clipped = int(ripple_time * pwr)/pwr
-            
-            ndx = np.where(np.isclose(t_array, clipped, atol=atol, rtol=rtol))[0]
-            
-            #print("ndx", ndx)
-            
-            if ndx.size == 1:
-                for k_spike in range(spike_count):
-                    
-                    stride = int(spike_isi * s_freq) * k_spike
-                        
-                    spike_index = int(ndx + stride)
-                    
-                    ripple_trace[spike_index] = spike_value 
-            
-                    for k in range(int(spike_duration * s_freq)):
-                        index = int(spike_index + k)
-                        if index < ripple_trace.size:
-                            ripple_trace[index] = spike_value
-                        
-                        
-            elif ndx.size == 0:
-                raise RuntimeError("spike time %g not found in the times array given start: %g, duration: %g, sampling frequency: %g and tolerances (atol: %g, rtol: %g). \nConsider increasing the tolerances or changing start and /or duration." \
-                    % (spike_time, t0, t_duration, s_freq, atol_, rtol_))
-            
-            else:
-                raise RuntimeError("ambiguous spike time found for %g, given start: %g, duration: %g, sampling frequency: %g and tolerances (atol: %g, rtol: %g). \nConsider decreasing the tolerances" \
-                    % (spike_time, t0, t_duration, s_freq, atol_, rtol_))
+        __fill_pulses__(ripple_trace, starts.ravel(), 
+                        max(int(spike_duration * s_freq), 1), spike_value)
             
         return ripple_trace
             
@@ -7169,13 +8001,16 @@ def generate_ripple_trace(ripple_times, start, duration, sampling_frequency,
     if spike_isi * sampling_frequency <= 1:
         raise ValueError("Either sampling frequency %g is too small or spike isi %g is too large")
     
-    times_array = np.arange(start, start+duration, step=1/sampling_frequency)
+    # NOTE: the trace has as many samples as 
+    # np.arange(start, start+duration, step=1/sampling_frequency), but the 
+    # time array itself is not needed
+    n_samples = max(int(np.ceil(((start + duration) - start) * sampling_frequency)), 0)
     
     print("Generating trace ...")
 
        
     try:
-        ret = __inner_generate_ripples__(times_array, ripple_times, 
+        ret = __inner_generate_ripples__(n_samples, ripple_times, 
                                         start, duration, 
                                         sampling_frequency,
                                         skipInvalidTimes, atol, rtol)
@@ -7200,7 +8035,7 @@ def generate_spike_trace(spike_times, start, duration, sampling_frequency,
                          asNeoSignal=True, 
                          time_units = pq.s, spike_units=pq.mV,
                          name="Spike trace", description="Synthetic spike trace",
-                         **annotations):
+                         dtype=float, **annotations):
     """
     Converts a spike times array file to an AnalogSignal.
     
@@ -7242,6 +8077,9 @@ def generate_spike_trace(spike_times, start, duration, sampling_frequency,
         then a list of analogsignals (one per sweep) will be produced having 
         a duration specified here
         
+    dtype: numpy dtype of the generated trace (default is float i.e. float64)
+        The traces are piecewise constant, so np.float32 is usually enough and
+        halves the memory used by the trace.
         
     asNeoSignal: bool (default, False) 
         When False, (the default) the function returns the spike trace as a 1D array
@@ -7267,44 +8105,21 @@ def generate_spike_trace(spike_times, start, duration, sampling_frequency,
         
     """
     
-    def __inner_trace_generate__(t_array, sp_times, t0, t_duration, 
+    def __inner_trace_generate__(n_samples, i0, sp_times, t0, t_duration, 
                                  s_freq, skip_invalid, atol_, rtol_):
         
-        spike_trace = np.full_like(t_array, 0.0)
-        
-        order = int(np.log10(s_freq))
+        spike_trace = np.zeros(n_samples, dtype=dtype)
         
-        pwr = eval("1e%d" % order)
+        # NOTE: the spike times are located by their index in the (uniform) 
+        # time array, instead of searching the time array for each spike
+        ndx = __spike_trace_indices__(n_samples, i0, start, sp_times, t0, t_duration, 
+                                      s_freq, skip_invalid, atol_, rtol_)
         
-        # take a slow for loop version otherwise we'd run out of memory pretty quickly
-        # if we were to use numpy broadcasting here
-        for k, spike_time in enumerate(sp_times):
-            if skip_invalid:
-                if spike_time < start or spike_time > (t0 + t_duration):
-                    continue
-                
-            clipped = int(spike_time * pwr) / pwr
-            
-            ndx = np.where(np.isclose(t_array, clipped, atol=atol_, rtol=rtol_))[0]
-            
-            if ndx.size == 1:
-                spike_trace[int(ndx)] = spike_value # this is just ONE sample
-                
-                # but the "spike" is a pulse waveform, so go ahead and generate the
-                # rest of the waveform, too (for the spike_duration)
-                for k in range(int(spike_duration * s_freq)):
-                    index = int(ndx) + k
-                    if index < spike_trace.size:
-                        spike_trace[index] = spike_value
+        # NOTE: the "spike" is a pulse waveform lasting spike_duration, and at 
+        # least one sample
+        __fill_pulses__(spike_trace, ndx, max(int(spike_duration * s_freq), 1), 
+                        spike_value)
         
-            elif ndx.size == 0:
-                raise RuntimeError("spike time %g not found in the times array given start: %g, duration: %g, sampling frequency: %g and tolerances (atol: %g, rtol: %g). \nConsider increasing the tolerances or changing start and /or duration." \
-                    % (spike_time, t0, t_duration, s_freq, atol_, rtol_))
-            
-            else:
-                raise RuntimeError("ambiguous spike time found for %g, given start: %g, duration: %g, sampling frequency: %g and tolerances (atol: %g, rtol: %g). \nConsider decreasing the tolerances" \
-                    % (spike_time, t0, t_duration, s_freq, atol_, rtol_))
-            
         return spike_trace
     
     
@@ -7325,10 +8140,27 @@ def generate_spike_trace(spike_times, start, duration, sampling_frequency,
         warnings.warn("Start time (%s) is greater than the minimum spike time (%s)" \
             % (start, float(np.min(spike_times))), RuntimeWarning)
     
-    times_array = np.arange(start, start+duration, step=1/sampling_frequency)
+    # NOTE: the samples are those of 
+    # np.arange(start, start+duration, step=1/sampling_frequency), but the 
+    # time array itself is not needed; sweeps are ranges of sample indices
+    step = 1 / sampling_frequency
+    
+    n_samples = max(int(np.ceil(((start + duration) - start) / step)), 0)
+    
+    def __first_sample_from__(t):
+        # index of the first sample at or after t
+        k = min(max(int(np.ceil((t - start) / step)), 0), n_samples)
+        
+        while k > 0 and start + (k - 1) * step >= t:
+            k -= 1
+            
+        while k < n_samples and start + k * step < t:
+            k += 1
+            
+        return k
     
     if maxSweepDuration is not None:
-        nSweeps = duration//maxSweepDuration
+        nSweeps = int(duration//maxSweepDuration)
         if duration % maxSweepDuration > 0:
             nSweeps += 1
             
@@ -7339,16 +8171,24 @@ def generate_spike_trace(spike_times, start, duration, sampling_frequency,
     
     if nSweeps > 1:
         print("Generating %d traces ..." % nSweeps)
+        
+        # NOTE: with the spike times sorted, the spikes of each sweep are a 
+        # slice found by bisection, instead of a boolean mask over all spikes
+        sorted_spike_times = np.sort(np.ravel(spike_times))
 
         for k in range(nSweeps):
             start_time = float(k * maxSweepDuration)
             stop_time = float((k+1) * maxSweepDuration)
             
-            times_sub_array = times_array[(times_array >= start_time) & (times_array < stop_time)]
-            spike_sub_array = spike_times[(spike_times >= start_time) & (spike_times < stop_time)]
+            i0 = __first_sample_from__(start_time)
+            i1 = __first_sample_from__(stop_time)
+            
+            j0, j1 = np.searchsorted(sorted_spike_times, (start_time, stop_time))
+            
+            spike_sub_array = sorted_spike_times[j0:j1]
             
             try:
-                ret = __inner_trace_generate__(times_sub_array, spike_sub_array, 
+                ret = __inner_trace_generate__(i1 - i0, i0, spike_sub_array, 
                                                start_time, maxSweepDuration, 
                                                sampling_frequency,
                                                skipInvalidTimes, atol, rtol)
@@ -7375,7 +8215,7 @@ def generate_spike_trace(spike_times, start, duration, sampling_frequency,
         print("Generating trace ...")
         
         try:
-            ret = __inner_trace_generate__(times_array, spike_times, 
+            ret = __inner_trace_generate__(n_samples, 0, spike_times, 
                                             start, duration, 
                                             sampling_frequency,
                                             skipInvalidTimes, atol, rtol)
@@ -7469,7 +8309,6 @@ def parse_trigger_protocols(src):
             
         
     """
-    from . import datatypes as dt
     
     def __compose_protocol__(events, protocol_list, index = None):
         """
@@ -7485,7 +8324,6 @@ def parse_trigger_protocols(src):
             When None the protocol's segment indices will not be changed
         
         """
-        from . import datatypes as dt
 
         pr_names = []
         pr_first = []
@@ -7677,7 +8515,6 @@ def set_relative_time_start(data, t = 0 * pq.s):
     TODO: propagate to other members of a segment as well 
     (IrregularlySampledSignal, epochs, spike trains, etc)
     """
-    from . import datatypes as dt
 
     if isinstance(data, neo.Block):
         for segment in data.segments:
@@ -7923,7 +8760,6 @@ def lookup(signal, value, channel=0, rtol=1e-05, atol=1e-08, equal_nan = False,
     indices where domain <= upper limit and those where domain >= lower limit.
     
     """
-    from . import datatypes as dt
     
     if not isinstance(signal, (neo.AnalogSignal, neo.IrregularlySampledSignal, 
                              DataSignal, IrregularlySampledDataSignal)):
@@ -8084,8 +8920,6 @@ def inverse_lookup(signal, value, channel=0, rtol=1e-05, atol=1e-08, equal_nan =
     
     """
     
-    from . import datatypes as dt
-    
     if not isinstance(signal, (neo.AnalogSignal, neo.IrregularlySampledSignal, 
                              DataSignal, IrregularlySampledDataSignal)):
         raise TypeError("signal expected to be a signal; got %s instead" % type(signal).__name__)
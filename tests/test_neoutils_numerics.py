@@ -0,0 +1,153 @@
+"""Regression checks for the vectorized / compiled numerical paths in core.neoutils.
+
+Each check compares a fast path against a straightforward reference
+computation on synthetic data.
+
+Run from the top of the source tree with:
+
+    python -m pytest tests
+
+The checks are skipped when core.neoutils cannot be imported (e.g. when the
+scipyen dependencies are not installed).
+"""
+import numpy as np
+import quantities as pq
+import pytest
+
+neo = pytest.importorskip("neo")
+neoutils = pytest.importorskip("core.neoutils")
+
+def __make_segments__(n_segments=6, n_samples=1000, n_signals=2, seed=0):
+    rng = np.random.default_rng(seed)
+
+    ret = list()
+
+    for k in range(n_segments):
+        seg = neo.Segment(name="segment_%d" % k)
+
+        for j in range(n_signals):
+            seg.analogsignals.append(neo.AnalogSignal(rng.normal(size=(n_samples, 1)),
+                                                      units=pq.mV,
+                                                      sampling_rate=10*pq.kHz,
+                                                      name="signal_%d" % j))
+        ret.append(seg)
+
+    return ret
+
+def test_average_segments_matches_sequential_sum():
+    segments = __make_segments__()
+
+    before = [[s.magnitude.copy() for s in seg.analogsignals] for seg in segments]
+
+    for analog_index in (None, 1, "signal_1", ["signal_0", 1]):
+        avg = neoutils.average_segments(segments, analog_index=analog_index)
+
+        if analog_index is None:
+            ndx = [0, 1]
+
+        elif isinstance(analog_index, list):
+            ndx = [0, 1]
+
+        else:
+            ndx = [1]
+
+        assert len(avg) == 1
+        assert len(avg[0].analogsignals) == len(ndx)
+
+        for sig, j in zip(avg[0].analogsignals, ndx):
+            # NOTE: reference: accumulate the segments one by one, then divide
+            expected = np.array(segments[0].analogsignals[j].magnitude, dtype=np.float64)
+
+            for seg in segments[1:]:
+                expected += seg.analogsignals[j].magnitude
+
+            expected /= len(segments)
+
+            np.testing.assert_array_equal(sig.magnitude, expected)
+
+            assert sig.units == segments[0].analogsignals[j].units
+
+    # NOTE: the signals being averaged are only read
+    for seg, data in zip(segments, before):
+        for s, d in zip(seg.analogsignals, data):
+            np.testing.assert_array_equal(s.magnitude, d)
+
+@pytest.mark.parametrize("count, every", [(2, 2), (3, 2), (2, 3)])
+@pytest.mark.parametrize("use_numba", [True, False])
+def test_average_segments_every_count(count, every, use_numba, monkeypatch):
+    if not use_numba:
+        monkeypatch.setattr(neoutils, "__has_numba__", False)
+
+    segments = __make_segments__(n_segments=7)
+
+    avg = neoutils.average_segments(segments, count=count, every=every)
+
+    starts = range(0, len(segments), every)
+
+    assert len(avg) == len(starts)
+
+    for start, seg in zip(starts, avg):
+        averaged = segments[start:start + count]
+
+        for j, sig in enumerate(seg.analogsignals):
+            expected = np.array(averaged[0].analogsignals[j].magnitude, dtype=np.float64)
+
+            for s in averaged[1:]:
+                expected += s.analogsignals[j].magnitude
+
+            expected /= len(averaged)
+
+            np.testing.assert_array_equal(sig.magnitude, expected)
+
+def test_uniform_pchip_matches_scipy():
+    from scipy.interpolate import PchipInterpolator
+
+    rng = np.random.default_rng(1)
+
+    y = np.cumsum(rng.normal(size=(50, 3)), axis=0)
+
+    # NOTE: include the sample positions themselves, and the last sample
+    x = np.concatenate([np.linspace(0, 49, 331), np.arange(50.)])
+
+    expected = PchipInterpolator(np.arange(50.), y, axis=0)(x)
+
+    np.testing.assert_allclose(neoutils.__uniform_pchip__(y, x), expected, rtol=1e-12, atol=1e-12)
+
+    # flat stretches and extrema
+    y = np.array([[0.], [0.], [1.], [1.], [0.], [2.], [2.]])
+    x = np.linspace(0, 6, 61)
+
+    expected = PchipInterpolator(np.arange(7.), y, axis=0)(x)
+
+    np.testing.assert_allclose(neoutils.__uniform_pchip__(y, x), expected, rtol=1e-12, atol=1e-12)
+
+@pytest.mark.parametrize("dtype", [np.float16, np.float32, np.float64, np.int16])
+def test_trigger_edges_compiled_matches_numpy(dtype, monkeypatch):
+    rng = np.random.default_rng(2)
+
+    data = np.zeros(10000)
+
+    for start in rng.choice(np.arange(10, 9900, 100), 40, replace=False):
+        data[start:start + rng.integers(5, 50)] = 5
+
+    data[0] = 5 # starts high
+    data[-3:] = 5 # ends high
+
+    data = data.astype(dtype)
+
+    diffcode = np.diff((data > 2.5).view(np.int8))
+
+    expected = (np.flatnonzero(diffcode == 1), np.flatnonzero(diffcode == -1))
+
+    up, down = neoutils.__trigger_edges__(data, 2.5)
+
+    np.testing.assert_array_equal(up, expected[0])
+    np.testing.assert_array_equal(down, expected[1])
+
+    # NOTE: the numpy code path, when numba is not available
+    monkeypatch.setattr(neoutils, "__has_numba__", False)
+
+    up, down = neoutils.__trigger_edges__(data, 2.5)
+
+    np.testing.assert_array_equal(up, expected[0])
+    np.testing.assert_array_equal(down, expected[1])